@@ -0,0 +1,152 @@
+"""
+Throughput and parity check for the embedding backends.
+
+Embeds the snippets of a Python source tree (loca's own by default) with the
+reference torch backend and each candidate backend, reports texts per second,
+and fails if any candidate vector's cosine similarity to the reference falls
+below the tolerance. With --workers, the torch backend is also run in pools of
+that many embedding worker processes (`loca index --embed-workers`) to show
+how throughput scales with cores.
+
+Usage:
+    python benchmarks/embedders.py [--backends torch-int8 onnx] [--model-dir DIR]
+        [--source loca] [--limit 512] [--batch-size 64] [--tolerance 0.98]
+        [--workers 2 4 8]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+from loca.embedder import Embedder, OnnxEmbedder, PooledEmbedder, TorchEmbedder
+from loca.snippet import extract_snippets
+
+
+def load_texts(source: Path, limit: int) -> list[str]:
+    texts: list[str] = []
+    for file in sorted(source.rglob("*.py")):
+        content = file.read_text(encoding="utf-8")
+        texts.extend(s.get_embedding_text() for s in extract_snippets(str(file), content))
+    return texts[:limit]
+
+
+def cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def timed_encode(
+    embedder: Embedder, texts: list[str], batch_size: int
+) -> tuple[list[list[float]], float]:
+    """
+    Returns (vectors, texts per second), excluding model loading and warm-up.
+    """
+    embedder.load()
+    embedder.encode(texts[:batch_size], batch_size)
+    start = time.perf_counter()
+    vectors = embedder.encode(texts, batch_size)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["torch-int8", "onnx"],
+        default=["torch-int8"],
+        help="Candidate backends compared to torch (default: torch-int8).",
+    )
+    parser.add_argument(
+        "--model-dir",
+        type=str,
+        help="Directory with model.onnx and tokenizer.json for the onnx backend.",
+    )
+    parser.add_argument(
+        "--source",
+        type=Path,
+        default=Path(__file__).resolve().parent.parent / "loca",
+        help="Source tree whose snippets are embedded (default: the loca package).",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=512,
+        help="Maximum number of snippets to embed (default: 512).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Texts per encode batch (default: 64).",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.98,
+        help="Minimum cosine similarity to the reference vectors (default: 0.98).",
+    )
+    parser.add_argument(
+        "--workers",
+        nargs="*",
+        type=int,
+        default=[],
+        help="Also run torch in pools of this many worker processes, each with an equal share of the cores.",
+    )
+    args = parser.parse_args()
+
+    texts = load_texts(args.source, args.limit)
+    if not texts:
+        print(f"No snippets found in {args.source}.")
+        return 1
+    # Queries are short, so measure them separately from snippets
+    queries = [text.splitlines()[0][:80] for text in texts]
+
+    reference = TorchEmbedder()
+    ref_vectors, ref_rate = timed_encode(reference, texts, args.batch_size)
+    ref_query_vectors, ref_query_rate = timed_encode(reference, queries, args.batch_size)
+    print(f"{'backend':12}  {'texts/s':>9}  {'speedup':>7}  {'queries/s':>9}  {'speedup':>7}  {'min cos':>7}")
+    print(f"{'torch':12}  {ref_rate:9.1f}  {1.0:7.2f}  {ref_query_rate:9.1f}  {1.0:7.2f}  {1.0:7.4f}")
+
+    failed = False
+    candidates: list[tuple[str, Embedder]] = []
+    for backend in args.backends:
+        if backend == "onnx":
+            if args.model_dir is None:
+                print("onnx          skipped (no --model-dir)")
+                continue
+            embedder: Embedder = OnnxEmbedder(args.model_dir)
+        else:
+            embedder = TorchEmbedder(quantize=True)
+        candidates.append((backend, embedder))
+    for workers in args.workers:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        candidates.append((f"torch x{workers}", PooledEmbedder("torch", workers, threads)))
+
+    for backend, embedder in candidates:
+        vectors, rate = timed_encode(embedder, texts, args.batch_size)
+        query_vectors, query_rate = timed_encode(embedder, queries, args.batch_size)
+        embedder.close()
+        min_cosine = min(
+            cosine(a, b)
+            for a, b in zip(vectors + query_vectors, ref_vectors + ref_query_vectors)
+        )
+        ok = min_cosine >= args.tolerance
+        failed |= not ok
+        print(
+            f"{backend:12}  {rate:9.1f}  {rate / ref_rate:7.2f}  {query_rate:9.1f}  "
+            f"{query_rate / ref_query_rate:7.2f}  {min_cosine:7.4f}{'' if ok else '  FAIL'}"
+        )
+
+    if failed:
+        print(f"\nCosine similarity to the torch backend fell below {args.tolerance}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
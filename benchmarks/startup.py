@@ -0,0 +1,100 @@
+"""
+Startup regression check for the lightweight loca commands.
+
+Runs each command under `python -X importtime` and fails if it imports any
+heavy dependency or if loca's own imports exceed the time budget.
+
+Usage:
+    python benchmarks/startup.py [--budget-ms 150] [--repeat 5]
+"""
+
+import argparse
+import subprocess
+import sys
+from statistics import median
+
+HEAVY_MODULES = {"chromadb", "sentence_transformers", "torch", "xxhash", "numpy"}
+
+CHECKS: dict[str, list[str]] = {
+    "loca --help": ["-m", "loca.cli", "--help"],
+    "loca --version": ["-m", "loca.cli", "--version"],
+    "loca set-root --help": ["-m", "loca.cli", "set-root", "--help"],
+    "loca index --help": ["-m", "loca.cli", "index", "--help"],
+    "loca query --help": ["-m", "loca.cli", "query", "--help"],
+    "import loca.core": ["-c", "import loca.core"],
+}
+
+
+def parse_importtime(stderr: str) -> tuple[float, set[str]]:
+    """
+    Returns (milliseconds spent in imports from `loca` onwards, top-level
+    package names imported), ignoring interpreter startup imports like `site`.
+    """
+    total_us = 0
+    seen_loca = False
+    packages: set[str] = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        # Nested imports are indented by two spaces per level after the separator
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        package = name.strip().split(".")[0]
+        packages.add(package)
+        if package == "loca":
+            seen_loca = True
+        if seen_loca and depth == 0:
+            total_us += int(cumulative)
+    return total_us / 1000, packages
+
+
+def run_check(args: list[str]) -> tuple[float, set[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=150.0,
+        help="Maximum median import time per command in milliseconds (default: 150).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of runs per command; the median is compared to the budget (default: 5).",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for label, command in CHECKS.items():
+        timings = []
+        heavy: set[str] = set()
+        for _ in range(args.repeat):
+            elapsed_ms, packages = run_check(command)
+            timings.append(elapsed_ms)
+            heavy |= packages & HEAVY_MODULES
+        elapsed_ms = median(timings)
+        ok = not heavy and elapsed_ms <= args.budget_ms
+        failed |= not ok
+        status = "ok" if ok else "FAIL"
+        detail = f" (imports {', '.join(sorted(heavy))})" if heavy else ""
+        print(f"{status:4}  {elapsed_ms:8.1f} ms  {label}{detail}")
+
+    if failed:
+        print(f"\nStartup budget of {args.budget_ms:.0f} ms exceeded or heavy modules imported.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
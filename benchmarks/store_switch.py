@@ -0,0 +1,111 @@
+"""
+Regression check for switching the vector store backend back and forth.
+
+Indexes a small generated project with ChromaDB, switches to the NumPy store,
+renames a function and reindexes, then switches back to ChromaDB and
+reindexes. Fails if either store still returns the old name or misses the
+new one. Uses the hashing stub embedder of the benchmark suite, and all
+config and caches live in a temporary directory.
+
+Usage:
+    python benchmarks/store_switch.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from suite import StubEmbedder
+
+OLD_NAME = "load_user_record"
+NEW_NAME = "fetch_user_record"
+
+
+def use_store(backend: str) -> None:
+    """
+    Select `backend` in the configuration and drop the open store, as a new
+    `loca` process would.
+    """
+    import loca.chroma as chroma
+    from loca.config import add_to_config
+    from loca.constants import STORE_KEY
+
+    add_to_config(STORE_KEY, backend)
+    if chroma.chroma_client is None and chroma.collection is not None:
+        chroma.collection.close()
+    chroma.chroma_client, chroma.collection = None, None
+
+
+def stored_names() -> set[str]:
+    import loca.chroma as chroma
+
+    return {meta["name"] for meta in chroma.get_collection().get(include=["metadatas"])["metadatas"]}
+
+
+def run(workdir: Path) -> bool:
+    repo = workdir / "repo"
+    repo.mkdir()
+    module = repo / "users.py"
+    module.write_text(f"def {OLD_NAME}(user_id):\n    return user_id\n", encoding="utf-8")
+    (repo / "helpers.py").write_text("def add(a, b):\n    return a + b\n", encoding="utf-8")
+
+    # Point loca's config and caches at the temporary directory
+    import loca.config
+    import loca.utils
+
+    loca.config.CONFIG_FILE = workdir / "cache" / "loca" / "loca.config.json"
+    loca.config.CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    loca.utils.user_cache_dir = lambda name: str(workdir / "cache" / name)
+    from loca.config import add_to_config
+    from loca.constants import CURRENT_PROJECT_ROOT_KEY
+
+    add_to_config(CURRENT_PROJECT_ROOT_KEY, str(repo))
+    os.chdir(repo)
+
+    import loca.chroma as chroma
+    import loca.core as core
+
+    chroma.embedder = StubEmbedder()
+
+    def index() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            core.index(jobs=1)
+
+    def check(backend: str, expected: str) -> bool:
+        names = stored_names()
+        passed = expected in names and not ({OLD_NAME, NEW_NAME} - {expected}) & names
+        print(f"{'ok' if passed else 'FAIL':4}  {backend:6}  stored names: {', '.join(sorted(names))}")
+        return passed
+
+    use_store("chroma")
+    index()
+    ok = check("chroma", OLD_NAME)
+    use_store("numpy")
+    index()
+    module.write_text(f"def {NEW_NAME}(user_id):\n    return user_id\n", encoding="utf-8")
+    index()
+    ok &= check("numpy", NEW_NAME)
+    use_store("chroma")
+    index()
+    ok &= check("chroma", NEW_NAME)
+    return ok
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="loca-store-switch-") as workdir:
+        cwd = os.getcwd()
+        try:
+            ok = run(Path(workdir))
+        finally:
+            os.chdir(cwd)
+    if not ok:
+        print("\nA store serves snippets that are out of date after switching backends.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Reproducible indexing and query benchmark for loca.
+
+Generates a deterministic synthetic Python repository, then measures a cold
+index, a no-op reindex, a single-file-edit reindex, a line-shift reindex,
+snippet extraction, and query latency percentiles per search mode. A hashing
+stub embedder replaces the model and all config and caches live in a
+temporary directory, so runs are offline and leave the user's setup alone.
+
+Usage:
+    python benchmarks/suite.py [--files 200] [--functions 20] [--depth 2]
+        [--seed 0] [--queries 200] [--store chroma] [--jobs N]
+        [--output results.json] [--baseline baseline.json] [--tolerance 0.25]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from statistics import quantiles
+from typing import Any, Callable
+
+from loca.embedder import Embedder
+
+# Vocabulary for generated identifiers, docstrings and queries
+WORDS = (
+    "parse load save user cache token request config index query stream buffer "
+    "session record payment retry schema report upload search render metric"
+).split()
+
+
+class StubEmbedder(Embedder):
+    """
+    Deterministic bag-of-hashed-words embedder: texts sharing tokens get
+    similar vectors, with no model to download or load.
+    """
+
+    name = "benchmark-stub"
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def encode(self, texts: list[str], batch_size: int = 64) -> list[list[float]]:
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split():
+                vectors[i, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.tolist()
+
+
+def identifier(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{index}"
+
+
+def nested_body(rng: random.Random, depth: int, indent: str) -> list[str]:
+    if depth == 0:
+        return [f"{indent}return a + b"]
+    name = identifier(rng, depth)
+    return [
+        f"{indent}def {name}(a, b):",
+        *nested_body(rng, depth - 1, indent + "    "),
+        f"{indent}return {name}(a, b)",
+    ]
+
+
+def generate_module(rng: random.Random, index: int, functions: int, depth: int) -> str:
+    lines = [
+        f'"""Synthetic module {index}."""',
+        "import os",
+        "from collections import defaultdict",
+        "",
+        f"{rng.choice(WORDS).upper()}_LIMIT = {rng.randint(1, 1000)}",
+        "",
+    ]
+    methods = []
+    for j in range(functions):
+        name = identifier(rng, j)
+        body = [
+            f'    """{rng.choice(WORDS).capitalize()} the {rng.choice(WORDS)} of a {rng.choice(WORDS)}."""',
+            *nested_body(rng, depth, "    "),
+        ]
+        # Every fourth function becomes a method of the module's class
+        if j % 4 == 3:
+            methods.append((name, body))
+            continue
+        lines += ["", f"def {name}(a, b):", *body, ""]
+    if methods:
+        lines += ["", f"class {rng.choice(WORDS).capitalize()}Service{index}:"]
+        for name, body in methods:
+            lines += [f"    def {name}(self, a, b):", *("    " + line for line in body), ""]
+    return "\n".join(lines) + "\n"
+
+
+def generate_repo(root: Path, files: int, functions: int, depth: int, seed: int) -> list[Path]:
+    """
+    Write `files` modules spread over ten packages; the same arguments always
+    produce the same tree.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        path = root / f"package_{i % 10}" / f"module_{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(generate_module(rng, i, functions, depth), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def timed(f: Callable[[], Any]) -> float:
+    """
+    Run `f` with its output discarded and return the elapsed seconds.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        f()
+        return time.perf_counter() - start
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+def run(args: argparse.Namespace, workdir: Path) -> dict[str, Any]:
+    repo = workdir / "repo"
+    files = generate_repo(repo, args.files, args.functions, args.depth, args.seed)
+
+    # Point loca's config and caches at the temporary directory
+    import loca.config
+    import loca.utils
+
+    loca.config.CONFIG_FILE = workdir / "cache" / "loca" / "loca.config.json"
+    loca.config.CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    loca.utils.user_cache_dir = lambda name: str(workdir / "cache" / name)
+    from loca.config import add_to_config
+    from loca.constants import CURRENT_PROJECT_ROOT_KEY, STORE_KEY
+
+    add_to_config(CURRENT_PROJECT_ROOT_KEY, str(repo))
+    add_to_config(STORE_KEY, args.store)
+    os.chdir(repo)
+
+    import loca.chroma as chroma
+    import loca.core as core
+    from loca.snippet import extract_snippets
+
+    chroma.embedder = StubEmbedder()
+
+    contents = [(str(path.relative_to(repo)), path.read_text(encoding="utf-8")) for path in files]
+    start = time.perf_counter()
+    snippet_count = sum(len(extract_snippets(path, content)) for path, content in contents)
+    results: dict[str, Any] = {"extract_s": time.perf_counter() - start}
+
+    results["cold_index_s"] = timed(lambda: core.index(jobs=args.jobs))
+    results["noop_reindex_s"] = timed(lambda: core.index(jobs=args.jobs))
+
+    edited = files[0]
+    edited.write_text(
+        edited.read_text(encoding="utf-8").replace("return a + b", "return a - b", 1),
+        encoding="utf-8",
+    )
+    results["edit_reindex_s"] = timed(lambda: core.index(jobs=args.jobs))
+
+    shifted = files[len(files) // 2]
+    shifted.write_text("# shifted\n\n" + shifted.read_text(encoding="utf-8"), encoding="utf-8")
+    results["shift_reindex_s"] = timed(lambda: core.index(jobs=args.jobs))
+
+    rng = random.Random(args.seed)
+    queries = [f"{rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(args.queries)]
+    results["query"] = {}
+    for mode in ("lexical", "vector", "hybrid"):
+        # Warm up once so the first sample does not pay for opening the store
+        chroma.query(queries[0], 5, mode)
+        samples = []
+        for q in queries:
+            start = time.perf_counter()
+            chroma.query(q, 5, mode)
+            samples.append(time.perf_counter() - start)
+        results["query"][mode] = percentiles(samples)
+
+    return {
+        "config": {
+            "files": args.files,
+            "functions": args.functions,
+            "depth": args.depth,
+            "seed": args.seed,
+            "queries": args.queries,
+            "store": args.store,
+            "jobs": args.jobs,
+            "snippets": snippet_count,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    flat: dict[str, float] = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> bool:
+    """
+    Print each metric next to its baseline; returns False if any metric is
+    slower than the baseline by more than `tolerance` (a fraction).
+    """
+    if current["config"] != baseline.get("config"):
+        print("Warning: benchmark configuration differs from the baseline.\n")
+    now, then = flatten(current["results"]), flatten(baseline.get("results", {}))
+    ok = True
+    print(f"{'metric':26}  {'baseline':>10}  {'current':>10}  {'change':>8}")
+    for metric, value in now.items():
+        if metric not in then:
+            print(f"{metric:26}  {'-':>10}  {value:10.4f}")
+            continue
+        change = value / then[metric] - 1 if then[metric] else 0.0
+        regressed = change > tolerance
+        ok &= not regressed
+        print(
+            f"{metric:26}  {then[metric]:10.4f}  {value:10.4f}  {change:+8.1%}"
+            f"{'  FAIL' if regressed else ''}"
+        )
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=200,
+        help="Number of generated modules (default: 200).",
+    )
+    parser.add_argument(
+        "--functions",
+        type=int,
+        default=20,
+        help="Functions per module (default: 20).",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=2,
+        help="Nesting depth of inner functions (default: 2).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the generated repository and queries (default: 0).",
+    )
+    parser.add_argument(
+        "--queries",
+        type=int,
+        default=200,
+        help="Queries timed per search mode (default: 200).",
+    )
+    parser.add_argument(
+        "--store",
+        choices=["chroma", "numpy"],
+        default="chroma",
+        help="Vector store backend (default: chroma).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parser processes (default: CPU count).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Write the results as JSON to this file instead of stdout.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="Compare the results with this JSON file from an earlier run.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown relative to the baseline, as a fraction (default: 0.25).",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="loca-bench-") as workdir:
+        cwd = os.getcwd()
+        try:
+            report = run(args, Path(workdir))
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    elif not args.baseline:
+        print(output)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if not compare(report, baseline, args.tolerance):
+            print(f"\nSlower than the baseline by more than {args.tolerance:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,16 @@
 import json
+import os
+import sqlite3
 import sys
-from typing import Dict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 
 from .utils import get_project_cache_path
-from .constants import FILE_CACHE_FILENAME, SNIPPET_CACHE_FILENAME
+from .constants import FILE_CACHE_FILENAME, SNIPPET_CACHE_FILENAME, STATE_FILENAME
 
 
-def safe_cache_path(filename: str) -> str:
+def safe_cache_path(filename: str) -> Path:
     """
     Get a cache path, handling project root errors with colorized output and exit.
     """
@@ -20,49 +23,290 @@ def safe_cache_path(filename: str) -> str:
         sys.exit(1)
 
 
-def get_file_cache() -> Dict[str, str]:
+def file_cache_entry(file_hash: str, stat: os.stat_result) -> Dict[str, Any]:
     """
-    Returns a dictionary mapping file paths to their content.
-    This is used to cache file content for quick access.
+    File cache record: the content hash plus the stat signature it was taken at.
     """
-    cache_path = safe_cache_path(FILE_CACHE_FILENAME)
+    return {
+        "hash": file_hash,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+
+def cached_file_hash(entry: Union[Dict[str, Any], str, None]) -> Optional[str]:
+    """
+    Content hash of a file cache record. Older caches stored the bare hash.
+    """
+    if isinstance(entry, dict):
+        return entry.get("hash")
+    return entry
+
+
+def stat_matches(entry: Union[Dict[str, Any], str, None], stat: os.stat_result) -> bool:
+    """
+    Check whether a file's stat signature matches its cache record, meaning
+    the file can be treated as unchanged without reading it.
+    """
+    return (
+        isinstance(entry, dict)
+        and entry.get("size") == stat.st_size
+        and entry.get("mtime_ns") == stat.st_mtime_ns
+        and entry.get("inode") == stat.st_ino
+    )
+
+
+class IndexState:
+    """
+    Transactional SQLite store of the index state: one row per file (content
+    hash and stat signature) and one row per snippet (code hash and location),
+    linked to its file through an indexed `file_path` column.
+
+    Reads never load more than they need, and writes go through a single
+    transaction that is only committed once the vector database has been
+    updated, so an interrupted run leaves the previous state intact.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.conn = self._connect(path)
+        except sqlite3.DatabaseError:
+            # Corrupted state file: start over. Embeddings are still served
+            # from the embedding cache, so this costs a rescan, not a re-embed.
+            path.replace(path.with_suffix(".corrupt"))
+            self.conn = self._connect(path)
+
+    @staticmethod
+    def _connect(path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS snippets (
+                id TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                line_start INTEGER,
+                line_end INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS snippets_file_path ON snippets (file_path);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS text_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        return conn
+
+    def get_files(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns a dictionary mapping file paths to their content hash and stat signature.
+        """
+        rows = self.conn.execute("SELECT path, hash, size, mtime_ns, inode FROM files")
+        return {
+            path: {"hash": file_hash, "size": size, "mtime_ns": mtime_ns, "inode": inode}
+            for path, file_hash, size, mtime_ns, inode in rows
+        }
+
+    def get_file(self, file_path: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT hash, size, mtime_ns, inode FROM files WHERE path = ?", (file_path,)
+        ).fetchone()
+        if row is None:
+            return None
+        file_hash, size, mtime_ns, inode = row
+        return {"hash": file_hash, "size": size, "mtime_ns": mtime_ns, "inode": inode}
+
+    def get_file_snippets(self, file_path: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns a dictionary mapping the IDs of a file's snippets to their content hash and location.
+        """
+        rows = self.conn.execute(
+            "SELECT id, hash, line_start, line_end FROM snippets WHERE file_path = ?",
+            (file_path,),
+        )
+        return {
+            snippet_id: {"hash": snippet_hash, "line_start": line_start, "line_end": line_end}
+            for snippet_id, snippet_hash, line_start, line_end in rows
+        }
+
+    def set_file(self, file_path: str, entry: Dict[str, Any]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, hash, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+            (file_path, entry["hash"], entry.get("size"), entry.get("mtime_ns"), entry.get("inode")),
+        )
+
+    def set_file_snippets(self, file_path: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Replace the recorded snippets of a file.
+        """
+        self.conn.execute("DELETE FROM snippets WHERE file_path = ?", (file_path,))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO snippets (id, file_path, hash, line_start, line_end) VALUES (?, ?, ?, ?, ?)",
+            [
+                (snippet_id, file_path, e["hash"], e["line_start"], e["line_end"])
+                for snippet_id, e in entries.items()
+            ],
+        )
+
+    def remove_files(self, file_paths: Iterable[str]) -> List[str]:
+        """
+        Forget files that no longer exist.
+        Returns the IDs of their snippets, which must be removed from the database.
+        """
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS removed_files (path TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM removed_files")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO removed_files (path) VALUES (?)",
+            [(file_path,) for file_path in file_paths],
+        )
+        snippet_ids = [
+            snippet_id
+            for (snippet_id,) in self.conn.execute(
+                "SELECT s.id FROM snippets s JOIN removed_files r ON s.file_path = r.path"
+            )
+        ]
+        self.conn.execute(
+            "DELETE FROM snippets WHERE file_path IN (SELECT path FROM removed_files)"
+        )
+        self.conn.execute("DELETE FROM files WHERE path IN (SELECT path FROM removed_files)")
+        self.conn.execute("DELETE FROM removed_files")
+        return snippet_ids
+
+    def get_snippet_ids(self, file_paths: Iterable[str]) -> List[str]:
+        """
+        Returns the IDs of the recorded snippets of the given files.
+        """
+        snippet_ids: List[str] = []
+        file_paths = list(file_paths)
+        for i in range(0, len(file_paths), 500):
+            chunk = file_paths[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            snippet_ids.extend(
+                snippet_id
+                for (snippet_id,) in self.conn.execute(
+                    f"SELECT id FROM snippets WHERE file_path IN ({placeholders})", chunk
+                )
+            )
+        return snippet_ids
+
+    def counts(self) -> tuple[int, int]:
+        """
+        Returns (number of indexed files, number of indexed snippets).
+        """
+        (files,) = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        (snippets,) = self.conn.execute("SELECT COUNT(*) FROM snippets").fetchone()
+        return files, snippets
+
+    def get_meta(self, key: str) -> Optional[int]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: int) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def get_text_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM text_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_text_meta(self, key: str, value: Optional[str]) -> None:
+        """
+        Set a text value, or remove it if `value` is None.
+        """
+        if value is None:
+            self.conn.execute("DELETE FROM text_meta WHERE key = ?", (key,))
+        else:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO text_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def generation(self) -> int:
+        return self.get_meta("generation") or 0
+
+    def commit(self) -> None:
+        """
+        Commit the current run and bump the generation counter, which tells
+        long-running processes that the index changed.
+        """
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+        self.conn.commit()
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM files")
+        self.conn.execute("DELETE FROM snippets")
+        self.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def migrate_json_caches(state: IndexState) -> None:
+    """
+    Import the JSON caches written by older versions into an empty state
+    store, then remove them. Caches from before snippet locations were
+    recorded are dropped instead, which causes a one-time full reindex.
+    """
+    file_cache_path = safe_cache_path(FILE_CACHE_FILENAME)
+    snippet_cache_path = safe_cache_path(SNIPPET_CACHE_FILENAME)
+    if not (file_cache_path.exists() or snippet_cache_path.exists()):
+        return
     try:
-        with open(cache_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except json.JSONDecodeError:
-        # Corrupted cache file, reset to empty
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump({}, f, indent=4)
-        return {}
+        with open(file_cache_path, "r", encoding="utf-8") as f:
+            file_cache = json.load(f)
+        with open(snippet_cache_path, "r", encoding="utf-8") as f:
+            snippet_cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        file_cache, snippet_cache = {}, {}
+
+    if not state.get_files() and all(isinstance(e, dict) for e in snippet_cache.values()):
+        file_snippets: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for snippet_id, entry in snippet_cache.items():
+            file_path = snippet_id.partition(":")[0]
+            file_snippets.setdefault(file_path, {})[snippet_id] = entry
+        for file_path, entry in file_cache.items():
+            if isinstance(entry, str):
+                entry = {"hash": entry}
+            state.set_file(file_path, entry)
+            state.set_file_snippets(file_path, file_snippets.get(file_path, {}))
+        state.commit()
+
+    file_cache_path.unlink(missing_ok=True)
+    snippet_cache_path.unlink(missing_ok=True)
+
+
+def get_index_state() -> IndexState:
+    """
+    Open the index state store of the current project.
+    """
+    state = IndexState(safe_cache_path(STATE_FILENAME))
+    migrate_json_caches(state)
+    return state
 
 
-def get_snippet_cache() -> Dict[str, str]:
+def get_cache_generation() -> int:
     """
-    Returns a dictionary mapping snippet IDs to their content hash.
-    This is used to cache snippet content for quick access.
+    Marker that changes whenever an indexing run commits, used by
+    long-running processes to notice that the index was updated elsewhere.
     """
-    cache_path = safe_cache_path(SNIPPET_CACHE_FILENAME)
+    state = IndexState(safe_cache_path(STATE_FILENAME))
     try:
-        with open(cache_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except json.JSONDecodeError:
-        # Corrupted cache file, reset to empty
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump({}, f, indent=4)
-        return {}
-
-
-def save_file_cache(file_cache: Dict[str, str]) -> None:
-    cache_path = safe_cache_path(FILE_CACHE_FILENAME)
-    with open(cache_path, "w", encoding="utf-8") as f:
-        json.dump(file_cache, f, indent=4)
-
-
-def save_snippet_cache(snippet_cache: Dict[str, str]) -> None:
-    cache_path = safe_cache_path(SNIPPET_CACHE_FILENAME)
-    with open(cache_path, "w", encoding="utf-8") as f:
-        json.dump(snippet_cache, f, indent=4)
+        return state.generation()
+    finally:
+        state.close()
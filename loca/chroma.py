@@ -1,45 +1,595 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-import torch
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Literal, Optional
 
-from .utils import get_project_cache_path
+from .utils import batched, get_cache_root, get_project_cache_path, get_store_backend
 from .snippet import Snippet
+from .documents import decode_document, encode_document, get_compression
+from .embedder import PooledEmbedder, get_embedder
+from .embedding_cache import EmbeddingCache, embedding_key
+from .filters import Where, build_where, split_clause
+from .lexical import LexicalIndex, reciprocal_rank_fusion
+from .profiler import profiler
+from .vector_store import NumpyVectorStore
+from .constants import (
+    DEFAULT_BATCH_SIZE,
+    EMBEDDING_CACHE_FILENAME,
+    HYBRID_CANDIDATES_PER_RESULT,
+    LEXICAL_INDEX_FILENAME,
+    NUMPY_STORE_DIRNAME,
+    QUERY_CACHE_FILENAME,
+    QUERY_CACHE_MAX_ENTRIES,
+    STORE_LAYOUT_VERSION,
+)
+
+if TYPE_CHECKING:
+    import chromadb
+
+
+QueryMode = Literal["lexical", "vector", "hybrid"]
 
+embedder = get_embedder()
 
-project_cache_path = get_project_cache_path() / "chroma"
-model = SentenceTransformer(
-    "sentence-transformers/all-MiniLM-L6-v2",
-    device="cuda" if torch.cuda.is_available() else "cpu",
+# Query embeddings depend on the model only, so they are cached for every project
+query_cache = EmbeddingCache(
+    get_cache_root() / QUERY_CACHE_FILENAME,
+    embedder.name,
+    QUERY_CACHE_MAX_ENTRIES,
 )
-chroma_client = chromadb.PersistentClient(path=project_cache_path)
+# Codec the code of new records is stored with
+compression = get_compression()
+
+# The current project's stores, opened on first use: importing this module
+# needs no current project, and `query_all` opens every root itself
+embedding_cache: Optional[EmbeddingCache] = None
+lexical_index: Optional[LexicalIndex] = None
+# The client is only set for the ChromaDB store
+chroma_client: Optional["chromadb.ClientAPI"] = None
+collection: Any = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(
+            get_project_cache_path() / EMBEDDING_CACHE_FILENAME, embedder.name
+        )
+    return embedding_cache
 
-collection = chroma_client.get_or_create_collection(name="snippets")
 
-delete = collection.delete
+def get_lexical_index() -> LexicalIndex:
+    global lexical_index
+    if lexical_index is None:
+        lexical_index = LexicalIndex(get_project_cache_path() / LEXICAL_INDEX_FILENAME)
+    return lexical_index
 
 
-def add(snippets: list[Snippet]) -> None:
+def get_collection() -> Any:
     """
-    Add a list of Snippet objects to the ChromaDB collection.
+    The current project's collection, opened on first use.
+    """
+    global chroma_client, collection
+    if collection is None:
+        with profiler.stage("store.open"):
+            chroma_client, collection = open_collection(get_project_cache_path())
+    return collection
+
+
+def use_embed_workers(workers: int, threads: int) -> None:
+    """
+    Embed with a pool of `workers` processes, each running its own copy of
+    the configured model on `threads` threads, instead of in this process.
+    """
+    global embedder
+    embedder = PooledEmbedder(None, workers, threads)
+
+
+def open_collection(cache_path: Path) -> tuple[Optional["chromadb.ClientAPI"], Any]:
     """
-    if not snippets:
+    Open the vector store selected in the configuration under a project's
+    cache directory: a ChromaDB client and collection, or no client and the
+    memory-mapped NumPy store, which answers the same calls with exact search
+    and starts without loading ChromaDB.
+    """
+    if get_store_backend() == "numpy":
+        return None, NumpyVectorStore(cache_path / NUMPY_STORE_DIRNAME)
+    import chromadb
+
+    client = chromadb.PersistentClient(path=cache_path / "chroma")
+    return client, client.get_or_create_collection(name="snippets")
+
+
+def reload() -> None:
+    """
+    Re-open the collection so that changes written by other processes
+    (e.g. `loca index`) become visible to this one.
+    """
+    global chroma_client, collection
+    if collection is None:
         return
-    collection.add(
-        ids=[s.id for s in snippets],
-        documents=[s.code for s in snippets],
-        embeddings=[model.encode(s.get_embedding_text()) for s in snippets],
-        metadatas=[s.to_dict() for s in snippets],
-    )
+    if chroma_client is None:
+        collection.close()
+    else:
+        chroma_client.clear_system_cache()
+    chroma_client, collection = open_collection(get_project_cache_path())
+
 
+def count() -> int:
+    return get_collection().count()
+
+
+def delete(ids: list[str]) -> None:
+    with profiler.stage("store.delete", len(ids)):
+        get_collection().delete(ids=ids)
+    with profiler.stage("lexical.delete", len(ids)):
+        get_lexical_index().delete(ids)
+
+
+def embed(texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE) -> list[list[float]]:
+    """
+    Embed texts, running the model only on texts missing from the embedding cache.
+    """
+    return submit_embed(texts, batch_size)()
+
+
+def submit_embed(
+    texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+) -> Callable[[], list[list[float]]]:
+    """
+    Start embedding texts like `embed` and return a function that waits for
+    the embeddings, so that embedding workers can compute several batches at once.
+    """
+    keys = [embedding_key(text) for text in texts]
+    with profiler.stage("embedding_cache.get", len(keys)):
+        embeddings = get_embedding_cache().get_many(keys)
+    missing = {key: text for key, text in zip(keys, texts) if key not in embeddings}
+    if not missing:
+        return lambda: [embeddings[key] for key in keys]
+    with profiler.stage("embed", len(missing)):
+        pending = embedder.submit(list(missing.values()), batch_size)
+
+    def result() -> list[list[float]]:
+        with profiler.stage("embed.wait", len(missing)):
+            vectors = pending()
+        computed = dict(zip(missing.keys(), vectors))
+        with profiler.stage("embedding_cache.put", len(computed)):
+            get_embedding_cache().put_many(computed)
+        embeddings.update(computed)
+        return [embeddings[key] for key in keys]
+
+    return result
+
+
+def add(snippets: list[Snippet], batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """
+    Add a list of Snippet objects to the collection, replacing any
+    existing records with the same IDs.
+    Snippets are encoded and written in chunks of `batch_size`, so the model
+    sees real batches and only one chunk of embeddings is held at a time.
+    """
+    for batch in batched(snippets, batch_size):
+        upsert(batch, embed([s.get_embedding_text() for s in batch], batch_size))
+
+
+def upsert(snippets: list[Snippet], embeddings: list[list[float]]) -> None:
+    """
+    Write already embedded snippets to the collection and the lexical index.
+    """
+    with profiler.stage("store.upsert", len(snippets)):
+        get_collection().upsert(
+            ids=[s.id for s in snippets],
+            documents=[encode_document(s.code, compression) for s in snippets],
+            embeddings=embeddings,
+            metadatas=[s.to_metadata() for s in snippets],
+        )
+    with profiler.stage("lexical.add", len(snippets)):
+        get_lexical_index().add(snippets)
+
+
+def sync_lexical_index(batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """
+    Rebuild the lexical index from the collection if they have drifted apart,
+    e.g. for collections created before lexical search existed.
+    """
+    with profiler.stage("lexical.check"):
+        total = get_collection().count()
+        if get_lexical_index().count() == total:
+            return
+    with profiler.stage("lexical.rebuild", total):
+        get_lexical_index().clear()
+        for offset in range(0, total, batch_size):
+            records = get_collection().get(
+                limit=batch_size, offset=offset, include=["documents", "metadatas"]
+            )
+            get_lexical_index().add(
+                [
+                    Snippet.from_dict({**meta, "code": decode_document(doc)})
+                    for doc, meta in zip(records["documents"], records["metadatas"])
+                ]
+            )
+
+
+def update_metadata(snippets: list[Snippet]) -> None:
+    """
+    Refresh the stored metadata (e.g. line numbers) of unchanged snippets
+    without re-embedding them.
+    """
+    for batch in batched(snippets, DEFAULT_BATCH_SIZE):
+        with profiler.stage("store.update", len(batch)):
+            get_collection().update(
+                ids=[s.id for s in batch],
+                metadatas=[s.to_metadata() for s in batch],
+            )
+
+
+def layout() -> str:
+    """
+    The store backend, record layout and codec new records are written with,
+    as recorded in the index state once the store has been migrated to them.
+    """
+    return f"{get_store_backend()}:{STORE_LAYOUT_VERSION}:{compression}"
 
-def query(q: str, n_results: int = 5) -> chromadb.QueryResult:
-    query_embedding = model.encode(q)
-    return collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        include=["documents", "metadatas"],
-    )
+
+def migrate_layout(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Rewrite the documents and metadata of every stored record in the current
+    layout, e.g. dropping the copy of the code older versions kept in the
+    metadata, or re-encoding documents after the compression changed.
+    Embeddings are kept as they are. Returns the number of records rewritten.
+    """
+    store = get_collection()
+    with profiler.stage("store.get"):
+        ids = store.get(include=[])["ids"]
+    # ChromaDB re-embeds documents that are updated without their embeddings
+    include = ["documents", "metadatas"] + (["embeddings"] if chroma_client is not None else [])
+    for chunk in batched(ids, batch_size):
+        with profiler.stage("store.get", len(chunk)):
+            records = store.get(ids=chunk, include=include)
+        codes = [decode_document(doc) for doc in records["documents"]]
+        # Setting "code" to None deletes the key from metadata written by older versions
+        metadatas = [
+            {**Snippet.from_dict({**meta, "code": code}).to_metadata(), "code": None}
+            for meta, code in zip(records["metadatas"], codes)
+        ]
+        documents = [encode_document(code, compression) for code in codes]
+        with profiler.stage("store.update", len(chunk)):
+            if chroma_client is None:
+                store.update(ids=records["ids"], metadatas=metadatas, documents=documents)
+            else:
+                store.update(
+                    ids=records["ids"],
+                    embeddings=records["embeddings"],
+                    metadatas=metadatas,
+                    documents=documents,
+                )
+    return len(ids)
+
+
+def decode_results(results: "chromadb.QueryResult") -> "chromadb.QueryResult":
+    """
+    Decode the stored documents of a collection query result in place.
+    """
+    if results.get("documents"):
+        results["documents"] = [
+            [decode_document(doc) for doc in documents] for documents in results["documents"]
+        ]
+    return results
+
+
+def get(ids: list[str], source: Any = None) -> "chromadb.QueryResult":
+    """
+    Fetch stored snippets by ID from `source` (by default the current
+    project's collection), shaped like a single-query result in the order
+    of `ids`.
+    """
+    source = get_collection() if source is None else source
+    with profiler.stage("store.get", len(ids)):
+        records = source.get(ids=ids, include=["documents", "metadatas"]) if ids else {}
+    found = {
+        id_: (doc, meta)
+        for id_, doc, meta in zip(
+            records.get("ids", []),
+            records.get("documents", []),
+            records.get("metadatas", []),
+        )
+    }
+    ids = [id_ for id_ in ids if id_ in found]
+    return {
+        "ids": [ids],
+        "documents": [[decode_document(found[id_][0]) for id_ in ids]],
+        "metadatas": [[found[id_][1] for id_ in ids]],
+    }
+
+
+def embed_queries(qs: list[str]) -> list[list[float]]:
+    """
+    Embed queries, reusing the embeddings of previously seen identical
+    queries (for the same model) and encoding the rest in one batched
+    forward pass. The model is only loaded when something misses.
+    """
+    keys = [embedding_key(q) for q in qs]
+    with profiler.stage("query_cache.get", len(keys)):
+        cached = query_cache.get_many(list(dict.fromkeys(keys)))
+    misses = {key: q for key, q in zip(keys, qs) if key not in cached}
+    if misses:
+        with profiler.stage("embed", len(misses)):
+            encoded = embedder.encode(list(misses.values()))
+        computed = dict(zip(misses, encoded))
+        with profiler.stage("query_cache.put", len(computed)):
+            query_cache.put_many(computed)
+        cached.update(computed)
+    return [cached[key] for key in keys]
+
+
+def embed_query(q: str) -> list[float]:
+    return embed_queries([q])[0]
+
+
+def collection_where(
+    client: Optional["chromadb.ClientAPI"], lexical: LexicalIndex, where: Optional[Where]
+) -> Optional[Where]:
+    """
+    The filter to send to a collection. ChromaDB cannot match globs, so for
+    it a --path glob becomes the list of matching indexed files, or is
+    dropped when it matches every file; the NumPy store matches globs itself.
+    """
+    if client is None or where is None:
+        return where
+    clauses = []
+    for clause in where.get("$and", [where]):
+        field, op, value = split_clause(clause)
+        if op == "$glob":
+            file_paths = lexical.file_paths(value)
+            if file_paths is None:
+                continue
+            clause = {field: {"$in": file_paths}}
+        clauses.append(clause)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def vector_query(
+    q: str,
+    n_results: int,
+    include: Optional[list[str]] = None,
+    where: Optional[Where] = None,
+) -> "chromadb.QueryResult":
+    query_embedding = embed_query(q)
+    with profiler.stage("store.query"):
+        results = get_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["documents", "metadatas"] if include is None else include,
+            where=collection_where(chroma_client, get_lexical_index(), where),
+        )
+    return decode_results(results)
+
+
+def lexical_search(
+    q: str, n_results: int, where: Optional[Where] = None
+) -> list[tuple[str, float]]:
+    with profiler.stage("lexical.search"):
+        return get_lexical_index().search(q, n_results, where)
+
+
+def query(
+    q: str,
+    n_results: int = 5,
+    mode: QueryMode = "hybrid",
+    snippet_type: Optional[str] = None,
+    path: Optional[str] = None,
+    name: Optional[str] = None,
+) -> "chromadb.QueryResult":
+    """
+    Search the collection. "vector" ranks by embedding similarity,
+    "lexical" by BM25 over the inverted index (without loading the model),
+    and "hybrid" fuses both rankings with reciprocal-rank fusion.
+    Results can be restricted by snippet type, file path glob and name;
+    the filter is applied inside each search rather than to its results.
+    """
+    if path and not get_lexical_index().has_files(path):
+        return get([])
+    where = build_where(snippet_type, path, name)
+    if mode == "vector":
+        return vector_query(q, n_results, where=where)
+    if mode == "lexical":
+        return get([id_ for id_, _ in lexical_search(q, n_results, where)])
+
+    n_candidates = n_results * HYBRID_CANDIDATES_PER_RESULT
+    vector_ids = vector_query(q, n_candidates, include=[], where=where)["ids"][0]
+    lexical_ids = [id_ for id_, _ in lexical_search(q, n_candidates, where)]
+    return get(reciprocal_rank_fusion([vector_ids, lexical_ids])[:n_results])
+
+
+def batch_query(
+    qs: list[str],
+    n_results: int = 5,
+    mode: QueryMode = "hybrid",
+    snippet_type: Optional[str] = None,
+    path: Optional[str] = None,
+    name: Optional[str] = None,
+) -> list["chromadb.QueryResult"]:
+    """
+    Run several queries at once, with the same filters as `query`. All query
+    embeddings come from one batched encode and the vector side is a single
+    multi-vector collection query; returns one single-query result per query,
+    in order.
+    """
+    if not qs:
+        return []
+    if path and not get_lexical_index().has_files(path):
+        return [get([]) for _ in qs]
+    if mode == "lexical":
+        return [query(q, n_results, mode, snippet_type, path, name) for q in qs]
+    where = build_where(snippet_type, path, name)
+
+    n_candidates = n_results if mode == "vector" else n_results * HYBRID_CANDIDATES_PER_RESULT
+    query_embeddings = embed_queries(qs)
+    with profiler.stage("store.query", len(qs)):
+        results = get_collection().query(
+            query_embeddings=query_embeddings,
+            n_results=n_candidates,
+            include=["documents", "metadatas"] if mode == "vector" else [],
+            where=collection_where(chroma_client, get_lexical_index(), where),
+        )
+    if mode == "vector":
+        decode_results(results)
+        return [
+            {
+                "ids": [results["ids"][i]],
+                "documents": [results["documents"][i]],
+                "metadatas": [results["metadatas"][i]],
+            }
+            for i in range(len(qs))
+        ]
+
+    return [
+        get(
+            reciprocal_rank_fusion(
+                [vector_ids, [id_ for id_, _ in lexical_search(q, n_candidates, where)]]
+            )[:n_results]
+        )
+        for q, vector_ids in zip(qs, results["ids"])
+    ]
+
+
+class Shard:
+    """
+    The collection and lexical index of one registered root, opened to take
+    part in a query across all roots.
+    """
+
+    def __init__(self, root: Path) -> None:
+        cache_path = get_project_cache_path(root)
+        self.root = root
+        with profiler.stage("shard.open"):
+            self.client, self.collection = open_collection(cache_path)
+            self.lexical_index = LexicalIndex(cache_path / LEXICAL_INDEX_FILENAME)
+
+    def search(
+        self,
+        q: str,
+        query_embedding: Optional[list[float]],
+        n_results: int,
+        mode: QueryMode,
+        snippet_type: Optional[str] = None,
+        path: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> tuple[list[tuple[str, float]], list[tuple[str, float]]]:
+        """
+        Returns this root's vector candidates as (ID, distance) pairs and its
+        lexical candidates as (ID, BM25 score) pairs, each best first.
+        """
+        if path and not self.lexical_index.has_files(path):
+            return [], []
+        where = build_where(snippet_type, path, name)
+        vector: list[tuple[str, float]] = []
+        if mode != "lexical":
+            with profiler.stage("store.query"):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    include=["distances"],
+                    where=collection_where(self.client, self.lexical_index, where),
+                )
+            vector = list(zip(results["ids"][0], results["distances"][0]))
+        lexical: list[tuple[str, float]] = []
+        if mode != "vector":
+            with profiler.stage("lexical.search"):
+                lexical = self.lexical_index.search(q, n_results, where)
+        return vector, lexical
+
+    def close(self) -> None:
+        self.lexical_index.close()
+        if self.client is None:
+            self.collection.close()
+
+
+def query_all(
+    q: str,
+    roots: list[Path],
+    n_results: int = 5,
+    mode: QueryMode = "hybrid",
+    snippet_type: Optional[str] = None,
+    path: Optional[str] = None,
+    name: Optional[str] = None,
+) -> "chromadb.QueryResult":
+    """
+    Search every root in parallel with one shared query embedding, then merge
+    the per-root rankings: vector candidates by distance, lexical candidates
+    by BM25 score, and for "hybrid" both merged rankings with reciprocal-rank
+    fusion. IDs are prefixed with their root and metadata gains a "root" field.
+    """
+    n_candidates = n_results * HYBRID_CANDIDATES_PER_RESULT if mode == "hybrid" else n_results
+    with ThreadPoolExecutor(max_workers=max(len(roots), 1)) as pool:
+        # Roots are opened while the query is embedded
+        opening = [pool.submit(Shard, root) for root in roots]
+        query_embedding = embed_query(q) if mode != "lexical" else None
+        shards = [future.result() for future in opening]
+        try:
+            searches = list(
+                pool.map(
+                    lambda shard: shard.search(
+                        q, query_embedding, n_candidates, mode, snippet_type, path, name
+                    ),
+                    shards,
+                )
+            )
+            owners: dict[str, tuple[Shard, str]] = {}
+            vector: list[tuple[float, str]] = []
+            lexical: list[tuple[float, str]] = []
+            for shard, (shard_vector, shard_lexical) in zip(shards, searches):
+                for id_, distance in shard_vector:
+                    owners[f"{shard.root}/{id_}"] = (shard, id_)
+                    vector.append((distance, f"{shard.root}/{id_}"))
+                for id_, score in shard_lexical:
+                    owners[f"{shard.root}/{id_}"] = (shard, id_)
+                    lexical.append((-score, f"{shard.root}/{id_}"))
+            vector_keys = [key for _, key in sorted(vector)[:n_candidates]]
+            lexical_keys = [key for _, key in sorted(lexical)[:n_candidates]]
+            if mode == "vector":
+                keys = vector_keys[:n_results]
+            elif mode == "lexical":
+                keys = lexical_keys[:n_results]
+            else:
+                keys = reciprocal_rank_fusion([vector_keys, lexical_keys])[:n_results]
+
+            found: dict[str, tuple[str, dict]] = {}
+            for shard in shards:
+                shard_keys = [key for key in keys if owners[key][0] is shard]
+                records = get([owners[key][1] for key in shard_keys], shard.collection)
+                for id_, doc, meta in zip(
+                    records["ids"][0], records["documents"][0], records["metadatas"][0]
+                ):
+                    found[f"{shard.root}/{id_}"] = (doc, {**meta, "root": str(shard.root)})
+        finally:
+            for shard in shards:
+                shard.close()
+    keys = [key for key in keys if key in found]
+    return {
+        "ids": [keys],
+        "documents": [[found[key][0] for key in keys]],
+        "metadatas": [[found[key][1] for key in keys]],
+    }
+
+
+def clear_records() -> None:
+    """
+    Remove every snippet from the collection and the lexical index, keeping
+    the embedding caches so that re-adding them costs no model time.
+    """
+    global collection
+    get_collection()
+    if chroma_client is None:
+        collection.clear()
+    else:
+        chroma_client.delete_collection(name="snippets")
+        collection = chroma_client.get_or_create_collection(name="snippets")
+    get_lexical_index().clear()
 
 
 def clear() -> None:
-    chroma_client.delete_collection(name="snippets")
+    clear_records()
+    get_embedding_cache().clear()
+    query_cache.clear()
@@ -1,9 +1,16 @@
 import argparse
 import inspect
-from importlib.metadata import version, PackageNotFoundError
 import logging
 from colorama import init, Fore, Style
-from .core import commands
+
+from .constants import (
+    DEFAULT_WATCH_INTERVAL,
+    DOCUMENT_CODECS,
+    EMBEDDER_BACKENDS,
+    SNIPPET_TYPE_FILTERS,
+    STORE_BACKENDS,
+)
+from .profiler import profile_target, profiler
 
 
 # Suppress noisy logs from dependencies
@@ -12,6 +19,35 @@ logging.getLogger("chromadb").setLevel(logging.WARNING)
 logging.getLogger("chromadb.telemetry").setLevel(logging.CRITICAL)
 
 
+class VersionAction(argparse.Action):
+    """
+    Like argparse's "version" action, but only looks up the installed
+    version when the flag is actually used.
+    """
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from importlib.metadata import version, PackageNotFoundError
+
+        try:
+            __version__ = version("loca")
+        except PackageNotFoundError:
+            __version__ = "unknown"
+        parser.exit(message=f"{parser.prog} {__version__}\n")
+
+
+def add_profile_argument(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Print wall/CPU time, items and bytes per stage and embedder throughput; with FILE, also write them as JSON with Chrome trace events. Also enabled by LOCA_PROFILE=1 (or LOCA_PROFILE=FILE).",
+    )
+
+
 def main() -> None:
     init(autoreset=True)
 
@@ -20,22 +56,16 @@ def main() -> None:
         description="Local, privacy-first semantic code search. Instantly find relevant functions, classes, and files in and python codebase using natural language queries. Powered by embeddings, syntax parsing, and vector search.",
     )
 
-    try:
-        __version__ = version("loca")
-    except PackageNotFoundError:
-        __version__ = "unknown"
-
     parser.add_argument(
         "-v",
         "--version",
-        action="version",
-        version=f"%(prog)s {__version__}",
+        action=VersionAction,
         help="Show the version of loca.",
     )
 
     subparsers = parser.add_subparsers(
         dest="command",
-        help="Available commands: set-root, index, clear, query. Use -h after a command for details.",
+        help="Available commands: set-root, add-root, remove-root, roots, exclude, set-embedder, set-store, index, watch, serve, stats, clear, query. Use -h after a command for details.",
     )
 
     set_root_subparser = subparsers.add_parser(
@@ -51,11 +81,156 @@ def main() -> None:
         help="Path to the project root directory (default: current directory).",
     )
 
+    add_root_subparser = subparsers.add_parser(
+        name="add-root",
+        help="Register another project root to index and search alongside the others.",
+        description="Register another project root. Each root has its own index; `loca index --all` and `loca query --all` cover every registered root.",
+    )
+    add_root_subparser.add_argument(
+        "--path",
+        "-p",
+        type=str,
+        default=".",
+        help="Path to the project root directory (default: current directory).",
+    )
+
+    remove_root_subparser = subparsers.add_parser(
+        name="remove-root",
+        help="Unregister a project root.",
+        description="Unregister a project root. Its index is kept on disk.",
+    )
+    remove_root_subparser.add_argument(
+        "--path",
+        "-p",
+        type=str,
+        default=".",
+        help="Path to the project root directory (default: current directory).",
+    )
+
+    subparsers.add_parser(
+        name="roots",
+        help="List the registered project roots.",
+        description="List the registered project roots, marking the one the current directory belongs to.",
+    )
+
+    exclude_subparser = subparsers.add_parser(
+        name="exclude",
+        help="Add, remove or list patterns of files and directories that are never indexed.",
+        description="Add, remove or list gitignore-style patterns (e.g. 'build/', 'generated/*.py') of files and directories that are never indexed, in every project root. .gitignore and .locaignore files are honored as well, and directories holding a pyvenv.cfg are always skipped.",
+    )
+    exclude_subparser.add_argument(
+        "patterns",
+        nargs="*",
+        metavar="PATTERN",
+        help="Patterns to add (none to just list the current ones).",
+    )
+    exclude_subparser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Remove the given patterns instead of adding them.",
+    )
+
+    set_embedder_subparser = subparsers.add_parser(
+        name="set-embedder",
+        help="Choose the backend used to compute embeddings.",
+        description="Choose the backend used to compute embeddings: SentenceTransformer on torch (default), the same model with int8 dynamic quantization for faster CPU inference, or an ONNX export run with ONNX Runtime.",
+    )
+    set_embedder_subparser.add_argument(
+        "backend",
+        choices=EMBEDDER_BACKENDS,
+        help="Embedding backend.",
+    )
+    set_embedder_subparser.add_argument(
+        "--model-dir",
+        type=str,
+        help="Directory containing model.onnx and tokenizer.json (required for the onnx backend).",
+    )
+
+    set_store_subparser = subparsers.add_parser(
+        name="set-store",
+        help="Choose where embeddings are stored and searched.",
+        description="Choose where embeddings are stored and searched: a ChromaDB collection (default), or a memory-mapped NumPy matrix searched exactly, which starts much faster for query-only use.",
+    )
+    set_store_subparser.add_argument(
+        "backend",
+        choices=STORE_BACKENDS,
+        help="Vector store backend.",
+    )
+    set_store_subparser.add_argument(
+        "--compress",
+        choices=DOCUMENT_CODECS,
+        default=None,
+        help="Compress the code kept in the store (zstd needs the zstandard package). Existing records are rewritten by the next `loca index`.",
+    )
+
     index_subparser = subparsers.add_parser(
         name="index",
         help="Index your project’s Python files for fast semantic code search.",
         description="Scan and index all Python files in your project for semantic code search. Run this after setting the project root or when your code changes.",
     )
+    index_subparser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Number of snippets embedded and written per batch. Saved to the config for later runs (default: 64).",
+    )
+    index_subparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes used to read, hash and parse files (default: number of CPU cores).",
+    )
+    index_subparser.add_argument(
+        "--embed-workers",
+        type=int,
+        default=None,
+        help="Compute embeddings in N worker processes, each with its own model copy and an equal share of the CPU cores (default: in-process). Each batch is split between the workers and several batches are embedded at once.",
+    )
+    index_subparser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Read and hash every file instead of trusting unchanged size, mtime and inode.",
+    )
+    index_subparser.add_argument(
+        "--git",
+        action="store_true",
+        help="Only check the files git reports as changed since the last --git run (plus untracked ones), instead of every file.",
+    )
+    index_subparser.add_argument(
+        "--all",
+        dest="all_roots",
+        action="store_true",
+        help="Index every registered project root concurrently, sharing the --jobs budget.",
+    )
+    add_profile_argument(index_subparser)
+
+    watch_subparser = subparsers.add_parser(
+        name="watch",
+        help="Watch your project and keep the index up to date as files change.",
+        description="Watch your project for changes and incrementally reindex modified Python files. The model and database stay loaded, so the index stays fresh within about a second of a save.",
+    )
+    watch_subparser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=DEFAULT_WATCH_INTERVAL,
+        help=f"Seconds between checks for changed files (default: {DEFAULT_WATCH_INTERVAL}).",
+    )
+    add_profile_argument(watch_subparser)
+
+    serve_subparser = subparsers.add_parser(
+        name="serve",
+        help="Run a local query server that keeps the model loaded for fast queries.",
+        description="Run a local query server on a Unix socket. While it is running, `loca query` uses it automatically and skips loading the model and database, answering in milliseconds.",
+    )
+
+    stats_subparser = subparsers.add_parser(
+        name="stats",
+        help="Show index size and embedding cache hit/miss statistics.",
+        description="Show how many files and snippets are indexed, and the size and hit/miss counts of the snippet and query embedding caches.",
+    )
 
     clear_subparser = subparsers.add_parser(
         name="clear",
@@ -71,6 +246,7 @@ def main() -> None:
     query_subparser.add_argument(
         "q",
         type=str,
+        nargs="?",
         help="Your natural language search query.",
     )
     query_subparser.add_argument(
@@ -80,8 +256,49 @@ def main() -> None:
         default=5,
         help="Number of code results to display (default: 5).",
     )
+    query_subparser.add_argument(
+        "-m",
+        "--mode",
+        choices=["lexical", "vector", "hybrid"],
+        default="hybrid",
+        help="Search by keywords (lexical, BM25 over identifiers and code; no model needed), by meaning (vector), or both fused (hybrid, default).",
+    )
+    query_subparser.add_argument(
+        "--type",
+        dest="snippet_type",
+        choices=list(SNIPPET_TYPE_FILTERS),
+        help="Only return snippets of this type.",
+    )
+    query_subparser.add_argument(
+        "--path",
+        type=str,
+        metavar="GLOB",
+        help="Only return snippets from files matching this glob, relative to the project root (e.g. 'loca/*').",
+    )
+    query_subparser.add_argument(
+        "--name",
+        type=str,
+        help="Only return snippets with exactly this name.",
+    )
+    query_subparser.add_argument(
+        "--batch",
+        type=str,
+        metavar="FILE",
+        help="Run every query in FILE ('-' for stdin), one per line as text or JSON with a \"q\" field, and print the results as JSON lines.",
+    )
+    query_subparser.add_argument(
+        "--all",
+        dest="all_roots",
+        action="store_true",
+        help="Search every registered project root in parallel and merge the results.",
+    )
+    add_profile_argument(query_subparser)
 
     args = vars(parser.parse_args())
+
+    # Importing the command registry is deferred until a command actually runs
+    from .core import commands
+
     command = commands.get(args.get("command"))
 
     if command is None:
@@ -94,7 +311,15 @@ def main() -> None:
     sig = inspect.signature(command)
     accepted_args = sig.parameters.keys()
     command_args = {k: args.get(k) for k in accepted_args}
-    command(**command_args)
+    profile = profile_target(args.get("profile"))
+    if profile is None:
+        command(**command_args)
+        return
+    profiler.enable()
+    try:
+        command(**command_args)
+    finally:
+        profiler.report(profile)
 
 
 if __name__ == "__main__":
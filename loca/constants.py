@@ -5,9 +5,114 @@ import sys
 
 
 CURRENT_PROJECT_ROOT_KEY = "current_project_root"
+# Additional roots registered with `loca add-root`, searched by `loca query --all`
+PROJECT_ROOTS_KEY = "project_roots"
+BATCH_SIZE_KEY = "batch_size"
+EMBEDDER_KEY = "embedder"
+ONNX_MODEL_DIR_KEY = "onnx_model_dir"
+STORE_KEY = "store"
+# Codec of the code stored in the vector store, set with `loca set-store --compress`
+COMPRESSION_KEY = "compression"
+# Gitignore-style patterns added with `loca exclude`, relative to each project root
+EXCLUDE_KEY = "exclude"
 # Cache and config filenames
+STATE_FILENAME = "state.sqlite3"
+# Index state keys of `loca index --git`: the commit indexed and the files that differed from it
+GIT_COMMIT_META = "git_commit"
+GIT_DIRTY_META = "git_dirty"
+# Index state key of the record layout and codec the vector store was written with
+STORE_LAYOUT_META = "store_layout"
+# JSON caches written by older versions, migrated into the state store
 FILE_CACHE_FILENAME = "file_cache.json"
 SNIPPET_CACHE_FILENAME = "snippet_cache.json"
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+QUERY_CACHE_FILENAME = "query_cache.sqlite3"
 CONFIG_FILENAME = "loca.config.json"
 
 VENV_PATH = Path(sys.prefix).resolve()
+
+# Directories never scanned, in addition to virtualenvs and the configured excludes
+DEFAULT_EXCLUDES = (
+    ".git/",
+    ".hg/",
+    ".svn/",
+    "node_modules/",
+    "__pycache__/",
+    ".tox/",
+    ".nox/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+)
+# Files with gitignore-style patterns that apply to their directory and below
+IGNORE_FILENAMES = (".gitignore", ".locaignore")
+
+# Number of snippets encoded per model forward pass and written per collection.add
+DEFAULT_BATCH_SIZE = 64
+# Indexing overlaps parsing, embedding and writing: at most this many batches
+# wait between two stages (so embedding workers compute a few batches at once),
+# and each parse worker has this many files in flight
+PIPELINE_QUEUE_SIZE = 2
+PARSE_FILES_IN_FLIGHT_PER_JOB = 4
+# Files with no new snippets (e.g. only touched by a checkout) are checkpointed
+# once this many are waiting, so an interrupted run loses at most that many
+CHECKPOINT_FILES = 1000
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Embedding backends: SentenceTransformer on torch, the same with int8 dynamic
+# quantization, or an ONNX export of the model run with ONNX Runtime
+EMBEDDER_BACKENDS = ("torch", "torch-int8", "onnx")
+DEFAULT_EMBEDDER = "torch"
+# Token limit for ONNX models without a sentence_bert_config.json
+ONNX_MAX_SEQ_LENGTH = 256
+# Upper bound on cached embeddings; least recently used entries are evicted first
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+QUERY_CACHE_MAX_ENTRIES = 10_000
+# Cache hits are recorded in memory and written once this many entries were
+# used, with the next stored embeddings, or when the cache is closed
+EMBEDDING_CACHE_PENDING_MAX = 1000
+
+# Seconds between polls of the project tree in `loca watch`
+DEFAULT_WATCH_INTERVAL = 0.5
+# Without watchdog, known files are stat'ed only this often (in seconds);
+# directory mtimes, which reveal added, removed and renamed files, every interval
+WATCH_FILE_STAT_INTERVAL = 2.0
+
+SERVER_SOCKET_FILENAME = "server.sock"
+# Seconds a client waits for the query server before falling back to in-process search
+SERVER_TIMEOUT = 10.0
+
+# Vector store backends: a ChromaDB collection, or exact search over a
+# memory-mapped NumPy matrix without starting ChromaDB
+STORE_BACKENDS = ("chroma", "numpy")
+DEFAULT_STORE = "chroma"
+NUMPY_STORE_DIRNAME = "vectors"
+# The NumPy store rewrites its matrix once tombstoned rows outnumber live ones,
+# but only past this many rows
+VECTOR_STORE_COMPACT_MIN_ROWS = 1024
+# Stored records keep the code only as their document, optionally compressed,
+# and a metadata docstring cut to this many characters. Bump the version when
+# the record layout changes, so existing stores are migrated by `loca index`.
+STORE_LAYOUT_VERSION = 2
+DOCUMENT_CODECS = ("none", "zlib", "zstd")
+DEFAULT_COMPRESSION = "none"
+METADATA_DOCSTRING_MAX_CHARS = 200
+
+# `loca query --type` choices and the snippet types they select
+SNIPPET_TYPE_FILTERS = {
+    "function": "function",
+    "class": "class",
+    "import": "import",
+    "global": "global variable",
+}
+
+LEXICAL_INDEX_FILENAME = "lexical.sqlite3"
+# BM25 parameters and the reciprocal-rank-fusion constant used by hybrid search
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Each ranking fused by hybrid search contributes this many candidates per requested result
+HYBRID_CANDIDATES_PER_RESULT = 4
+
+# Enables `--profile` for every command: "1" prints the summary, any other
+# value is also the file the JSON/Chrome-trace report is written to
+PROFILE_ENV = "LOCA_PROFILE"
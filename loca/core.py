@@ -1,26 +1,71 @@
+import json
+import os
 from pathlib import Path
-from typing import Optional, Callable
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Callable
 import sys
-from chromadb import QueryResult
+import time
 import lazy_import
-from xxhash import xxh3_64_hexdigest
 from colorama import init, Fore, Style
 
 
-from .snippet import Snippet, extract_snippets
-from .utils import get_project_root, read_file, starts_with_any, scan_python_files
-from .constants import CURRENT_PROJECT_ROOT_KEY
+from .snippet import EXTRACTOR_VERSION, Snippet, extract_snippets
+from .utils import (
+    batched,
+    get_batch_size,
+    get_cache_root,
+    get_project_cache_path,
+    get_project_root,
+    get_registered_roots,
+    get_store_backend,
+    read_file,
+    scan_python_files,
+)
+from .constants import (
+    BATCH_SIZE_KEY,
+    CURRENT_PROJECT_ROOT_KEY,
+    PROJECT_ROOTS_KEY,
+    DEFAULT_WATCH_INTERVAL,
+    EMBEDDING_CACHE_FILENAME,
+    EMBEDDER_KEY,
+    EXCLUDE_KEY,
+    ONNX_MODEL_DIR_KEY,
+    STORE_KEY,
+    QUERY_CACHE_FILENAME,
+    PARSE_FILES_IN_FLIGHT_PER_JOB,
+    CHECKPOINT_FILES,
+    GIT_COMMIT_META,
+    GIT_DIRTY_META,
+    COMPRESSION_KEY,
+    STORE_LAYOUT_META,
+)
+from .pipeline import Pipeline
 from .progress import ProgressBar, Spinner
-from .config import add_to_config
+from .profiler import profiler, start_profiled_worker
+from .config import add_to_config, load_config
+from .scanner import get_excludes
+from .documents import check_codec
+from .watcher import PollingWatcher
+from .embedder import OnnxEmbedder, get_embedder
+from .embedding_cache import EmbeddingCache
+from . import git as git_repo
+from . import server
 
 
+if TYPE_CHECKING:
+    from chromadb import QueryResult
+
+# Heavy dependencies are only loaded once a command actually needs them,
+# keeping `loca --help`, `loca set-root` and friends fast.
 chroma = lazy_import.lazy_module("loca.chroma")
+xxh3_64_hexdigest = lazy_import.lazy_callable("xxhash.xxh3_64_hexdigest")
 
 from .cache import (
-    get_file_cache,
-    get_snippet_cache,
-    save_file_cache,
-    save_snippet_cache,
+    IndexState,
+    cached_file_hash,
+    file_cache_entry,
+    get_cache_generation,
+    get_index_state,
+    stat_matches,
 )
 
 init(autoreset=True)
@@ -50,12 +95,146 @@ def set_project_root(path: str = "."):
     print(f"{Fore.GREEN}✔ Project root set to: {project_root}{Style.RESET_ALL}\n")
 
 
+@command("add-root")
+def add_root(path: str = "."):
+    print(f"{Style.BRIGHT}📂 Registering project root...{Style.RESET_ALL}\n")
+    project_root = Path(path).resolve()
+    if not project_root.is_dir():
+        print(
+            f"{Fore.RED}❌ Invalid project root path: {project_root}{Style.RESET_ALL}\n"
+        )
+        sys.exit(1)
+    if project_root not in get_registered_roots():
+        roots = load_config().get(PROJECT_ROOTS_KEY, [])
+        add_to_config(PROJECT_ROOTS_KEY, roots + [str(project_root)])
+    print(f"{Fore.GREEN}✔ Registered project root: {project_root}{Style.RESET_ALL}\n")
+
+
+@command("remove-root")
+def remove_root(path: str = "."):
+    print(f"{Style.BRIGHT}📂 Unregistering project root...{Style.RESET_ALL}\n")
+    project_root = Path(path).resolve()
+    if project_root not in get_registered_roots():
+        print(f"{Fore.YELLOW}Not a registered project root: {project_root}{Style.RESET_ALL}\n")
+        return 1
+    config = load_config()
+    add_to_config(
+        PROJECT_ROOTS_KEY,
+        [root for root in config.get(PROJECT_ROOTS_KEY, []) if Path(root).resolve() != project_root],
+    )
+    current_root = config.get(CURRENT_PROJECT_ROOT_KEY)
+    if current_root and Path(current_root).resolve() == project_root:
+        add_to_config(CURRENT_PROJECT_ROOT_KEY, None)
+    print(f"{Fore.GREEN}✔ Unregistered project root: {project_root}{Style.RESET_ALL}")
+    print(
+        f"{Fore.YELLOW}Its index is kept; run `loca clear` inside it first to delete it.{Style.RESET_ALL}\n"
+    )
+
+
+@command()
+def roots():
+    """
+    List the registered project roots, marking the one the working directory is in.
+    """
+    registered = get_registered_roots()
+    if not registered:
+        print(f"{Fore.YELLOW}No project roots registered. Use `loca set-root` or `loca add-root`.{Style.RESET_ALL}\n")
+        return
+    try:
+        current_root = get_project_root()
+    except RuntimeError:
+        current_root = None
+    for root in registered:
+        marker = f"{Fore.GREEN}*{Style.RESET_ALL}" if root == current_root else " "
+        missing = "" if root.is_dir() else f" {Fore.RED}(missing){Style.RESET_ALL}"
+        print(f"{marker} {root}{missing}")
+    print()
+
+
+@command()
+def exclude(patterns: Optional[list[str]] = None, remove: bool = False):
+    """
+    Add (or with `remove`, remove) gitignore-style exclude patterns, then
+    list the configured ones.
+    """
+    excludes = get_excludes()
+    if patterns:
+        if remove:
+            excludes = [p for p in excludes if p not in patterns]
+        else:
+            excludes += [p for p in dict.fromkeys(patterns) if p not in excludes]
+        add_to_config(EXCLUDE_KEY, excludes)
+        print(f"{Fore.GREEN}✔ Exclude patterns updated; run `loca index` to apply them.{Style.RESET_ALL}\n")
+    if not excludes:
+        print(f"{Fore.YELLOW}No exclude patterns. .gitignore and .locaignore files are always honored.{Style.RESET_ALL}\n")
+        return
+    for pattern in excludes:
+        print(f"  {pattern}")
+    print()
+
+
+@command("set-embedder")
+def set_embedder(backend: str, model_dir: Optional[str] = None):
+    print(f"{Style.BRIGHT}🧠 Setting embedding backend...{Style.RESET_ALL}\n")
+    if backend == "onnx":
+        if model_dir is None:
+            print(f"{Fore.RED}❌ The onnx backend needs --model-dir.{Style.RESET_ALL}\n")
+            sys.exit(1)
+        model_path = Path(model_dir).expanduser().resolve()
+        if OnnxEmbedder.find_model(model_path) is None or not (model_path / "tokenizer.json").is_file():
+            print(
+                f"{Fore.RED}❌ No model.onnx and tokenizer.json found in: {model_path}{Style.RESET_ALL}\n"
+            )
+            sys.exit(1)
+        add_to_config(ONNX_MODEL_DIR_KEY, str(model_path))
+    add_to_config(EMBEDDER_KEY, backend)
+    print(f"{Fore.GREEN}✔ Embedding backend set to: {get_embedder().name}{Style.RESET_ALL}\n")
+
+
+@command("set-store")
+def set_store(backend: str, compress: Optional[str] = None):
+    print(f"{Style.BRIGHT}🗄️  Setting vector store...{Style.RESET_ALL}\n")
+    if compress is not None:
+        try:
+            check_codec(compress)
+        except RuntimeError as e:
+            print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+            sys.exit(1)
+        add_to_config(COMPRESSION_KEY, compress)
+    add_to_config(STORE_KEY, backend)
+    print(f"{Fore.GREEN}✔ Vector store set to: {backend}{Style.RESET_ALL}")
+    if compress is not None:
+        print(f"{Fore.GREEN}✔ Stored code compression set to: {compress}{Style.RESET_ALL}")
+    print(
+        f"{Fore.YELLOW}Run `loca index` to fill it; cached embeddings are reused.{Style.RESET_ALL}\n"
+    )
+
+
 @command()
-def query(q: str, n_results: int = 5):
+def query(
+    q: Optional[str] = None,
+    n_results: int = 5,
+    mode: str = "hybrid",
+    batch: Optional[str] = None,
+    snippet_type: Optional[str] = None,
+    path: Optional[str] = None,
+    name: Optional[str] = None,
+    all_roots: bool = False,
+):
+    filters = {"snippet_type": snippet_type, "path": path, "name": name}
+    if all_roots:
+        return query_all_roots(q, n_results, mode, batch, filters)
+    if batch is not None:
+        return batch_query(batch, n_results, mode, filters)
+    if not q:
+        print(f"{Fore.RED}❌ Provide a query or --batch FILE.{Style.RESET_ALL}\n")
+        sys.exit(1)
     print(f"{Style.BRIGHT}🔍 Searching for: {q}{Style.RESET_ALL}\n")
     try:
-        with Spinner("Searching database"):
-            results = chroma.query(q, n_results)
+        results = server.request("query", q=q, n_results=n_results, mode=mode, **filters)
+        if results is None:
+            with Spinner("Searching database"):
+                results = chroma.query(q, n_results, mode, **filters)
     except RuntimeError as e:
         print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
         return
@@ -64,149 +243,975 @@ def query(q: str, n_results: int = 5):
 
 
 @command()
-def index() -> None:
+def index(
+    batch_size: Optional[int] = None,
+    jobs: Optional[int] = None,
+    verify: bool = False,
+    all_roots: bool = False,
+    git: bool = False,
+    embed_workers: Optional[int] = None,
+) -> None:
     print(f"{Style.BRIGHT}📂 Starting indexing process...{Style.RESET_ALL}\n")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs < 1:
+        print(f"{Fore.RED}❌ Number of jobs must be at least 1.{Style.RESET_ALL}\n")
+        sys.exit(1)
+    if embed_workers is not None and embed_workers < 1:
+        print(f"{Fore.RED}❌ Number of embedding workers must be at least 1.{Style.RESET_ALL}\n")
+        sys.exit(1)
+    if batch_size is not None:
+        if batch_size < 1:
+            print(f"{Fore.RED}❌ Batch size must be at least 1.{Style.RESET_ALL}\n")
+            sys.exit(1)
+        add_to_config(BATCH_SIZE_KEY, batch_size)
+    else:
+        batch_size = get_batch_size()
+    if all_roots:
+        return index_all_roots(jobs, verify, git, embed_workers)
     try:
         path = get_project_root()
-        file_cache = get_file_cache()
-        new_file_cache = {}
-        snippet_cache = get_snippet_cache()
-        new_snippet_cache = {}
-        un_updated_files_prefixes = set()
-        snippets: list[Snippet] = []
+        state = get_index_state()
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    if embed_workers:
+        # The cores are split evenly between the workers' model copies
+        chroma.use_embed_workers(embed_workers, max(1, (os.cpu_count() or 1) // embed_workers))
+    try:
+        reset_if_store_empty(state)
+        migrate_store_layout(state, batch_size)
+        if state.get_meta("in_progress"):
+            print(f"{Fore.YELLOW}↻ Resuming an interrupted run from its last checkpoint{Style.RESET_ALL}\n")
+        file_cache = state.get_files()
+        parse_cache = file_cache
+        extraction_outdated = is_extraction_outdated(state)
+        if extraction_outdated:
+            # Snippets were extracted by an older version: re-extract every
+            # file, re-embedding only snippets whose code actually changed
+            parse_cache = {}
+        seen_files = set()
+        snippet_count = 0
+
+        changed_files, head, dirty_files = None, None, set()
+        if git and not verify:
+            with profiler.stage("git"):
+                changed_files, head, dirty_files = git_changes(path, state)
+            if head is None:
+                print(f"{Fore.YELLOW}⚠️  Not a git repository with commits; checking every file.{Style.RESET_ALL}\n")
+            elif changed_files is not None:
+                print(f"{Style.BRIGHT}🔀 {len(changed_files)} paths changed according to git{Style.RESET_ALL}\n")
+
+        # Checkpoints commit part of this run, which the recorded commit
+        # would no longer describe; it is recorded again once the run completes
+        set_git_state(state, None, set())
+        state.set_meta("in_progress", 1)
 
         print(f"{Style.BRIGHT}📁 Scanning Python files in: {path}{Style.RESET_ALL}\n")
 
-        python_files = scan_python_files(path)
+        with profiler.stage("scan") as counts:
+            python_files = scan_python_files(path)
+            counts.items = len(python_files)
 
         if not python_files:
             print(f"{Fore.YELLOW}⚠️  No Python files found!{Style.RESET_ALL}\n")
 
         progress = ProgressBar(len(python_files), "Indexing files")
 
-        for file in python_files:
-            is_cached, file_snippets, file_hash = process_python_file(
-                file, file_cache, snippet_cache, new_snippet_cache, path
-            )
-            new_file_cache[str(file.relative_to(path))] = file_hash
-            if is_cached:
-                un_updated_files_prefixes.add(str(file.relative_to(path)))
-                progress.update(item_name=f"{file.name} (cached)")
-            else:
-                snippets.extend(file_snippets)
-                progress.update(
-                    item_name=f"{file.name} ({len(file_snippets)} snippets)"
-                )
+        # Files are parsed and diffed here while earlier batches are embedded
+        # and written by the pipeline's threads. Each written batch is
+        # checkpointed: its files are recorded in the index state and committed.
+        batch = IndexBatch()
+        queued = 0
+        with Pipeline(
+            [lambda b: embed_batch(b, batch_size), collect_embeddings, write_batch]
+        ) as pipeline:
+            for file_path, file_entry, file_snippets in parse_python_files(
+                python_files, path, parse_cache, jobs, progress, verify, changed_files
+            ):
+                seen_files.add(file_path)
+                with profiler.stage("state.diff"):
+                    record, file_new, file_moved, file_stale = diff_file(
+                        state, file_path, file_entry, file_cache.get(file_path), file_snippets
+                    )
+                batch.extend(record, file_new, file_moved, file_stale)
+                snippet_count += len(file_new)
+                while len(batch) >= batch_size:
+                    pipeline.put(batch.take(batch_size))
+                    queued += 1
+                if batch.completed_files() >= CHECKPOINT_FILES:
+                    pipeline.put(batch.take(0))
+                    queued += 1
+                checkpoint(state, pipeline.completed())
+
+            deleted_files = sorted(file_cache.keys() - seen_files)
+            batch.extend(None, [], [], state.get_snippet_ids(deleted_files))
+            batch.removed_files = deleted_files
+            while not batch.empty():
+                pipeline.put(batch.take(batch_size))
+                queued += 1
+            if queued:
+                with Spinner("Writing the last batches"):
+                    pipeline.close()
+            checkpoint(state, pipeline.completed())
+        with Spinner("Checking lexical index"):
+            chroma.sync_lexical_index(batch_size)
+        if extraction_outdated:
+            state.set_meta("extractor_version", EXTRACTOR_VERSION)
+        set_git_state(state, head, dirty_files)
+        state.set_meta("in_progress", 0)
+        save_state_and_print(state, python_files, snippet_count)
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    finally:
+        # Closing without a commit discards the changes since the last checkpoint
+        state.close()
+        chroma.embedder.close()
+
 
-        # Database operations with spinner
-        update_database(
-            snippet_cache, new_snippet_cache, un_updated_files_prefixes, chroma
+@command()
+def watch(interval: float = DEFAULT_WATCH_INTERVAL) -> None:
+    """
+    Keep the index up to date by reindexing files as they change, with the
+    model and collection loaded once for the lifetime of the process.
+    """
+    print(f"{Style.BRIGHT}👀 Starting watch mode...{Style.RESET_ALL}\n")
+    try:
+        path = get_project_root()
+        state = get_index_state()
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    batch_size = get_batch_size()
+
+    watcher = None
+    try:
+        with Spinner("Loading model and database"):
+            chroma.embedder.load()
+        reset_if_store_empty(state)
+        migrate_store_layout(state, batch_size)
+        watcher = PollingWatcher(path, interval)
+        deleted = {path / file_path for file_path in state.get_files()}
+        chroma.sync_lexical_index(batch_size)
+        force = is_extraction_outdated(state)
+        if force:
+            state.set_meta("extractor_version", EXTRACTOR_VERSION)
+        reindex_files(
+            sorted(watcher.files),
+            deleted - watcher.files.keys(),
+            path,
+            state,
+            batch_size,
+            force,
+        )
+        print(f"{Fore.GREEN}✔ Watching {path} for changes (Ctrl+C to stop){Style.RESET_ALL}\n")
+
+        while True:
+            changed, deleted = watcher.wait_for_changes()
+            reindex_files(sorted(changed), deleted, path, state, batch_size)
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    except KeyboardInterrupt:
+        print(f"\n{Fore.YELLOW}Stopped watching.{Style.RESET_ALL}\n")
+    finally:
+        if watcher is not None:
+            watcher.close()
+        state.close()
+
+
+@command()
+def serve() -> None:
+    """
+    Serve queries over a local Unix socket, keeping the model and collection
+    loaded so that `loca query` skips the cold start.
+    """
+    print(f"{Style.BRIGHT}🚀 Starting query server...{Style.RESET_ALL}\n")
+    if not server.is_supported():
+        print(
+            f"{Fore.RED}❌ The query server needs Unix domain sockets, which this platform does not support.{Style.RESET_ALL}\n"
         )
-        if snippets:
-            with Spinner(f"Adding {len(snippets)} new snippets"):
-                chroma.add(snippets)
-        save_caches_and_print(new_file_cache, new_snippet_cache, python_files, snippets)
+        return 1
+    try:
+        path = server.socket_path()
+        with Spinner("Loading model and database"):
+            chroma.embedder.load()
+        generation = get_cache_generation()
+
+        def handle(method: str, params: dict[str, Any]) -> Any:
+            nonlocal generation
+            if method not in ("query", "batch_query"):
+                raise ValueError(f"Unknown method: {method}")
+            current_generation = get_cache_generation()
+            if current_generation != generation:
+                chroma.reload()
+                generation = current_generation
+            return getattr(chroma, method)(**params)
+
+        with server.QueryServer(path, handle) as query_server:
+            print(f"{Fore.GREEN}✔ Serving queries on {path} (Ctrl+C to stop){Style.RESET_ALL}\n")
+            query_server.serve_forever()
     except RuntimeError as e:
         print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
         return 1
+    except KeyboardInterrupt:
+        print(f"\n{Fore.YELLOW}Query server stopped.{Style.RESET_ALL}\n")
+
+
+@command()
+def stats() -> None:
+    """
+    Print the size of the index and how well the embedding caches are doing.
+    """
+    print(f"{Style.BRIGHT}📊 Collecting index statistics...{Style.RESET_ALL}\n")
+    try:
+        path = get_project_root()
+        cache_path = get_project_cache_path()
+        state = get_index_state()
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    try:
+        file_count, snippet_count = state.counts()
+    finally:
+        state.close()
+    embedder = get_embedder()
+    print(f"{Fore.CYAN}{Style.BRIGHT}Project:{Style.RESET_ALL} {path}")
+    print(f"   Indexed files: {file_count}")
+    print(f"   Indexed snippets: {snippet_count}")
+    print(f"   Embedder: {embedder.name}")
+    print(f"   Vector store: {get_store_backend()}\n")
+
+    for label, cache_file in (
+        ("Snippet embedding cache", cache_path / EMBEDDING_CACHE_FILENAME),
+        ("Query embedding cache (all projects)", get_cache_root() / QUERY_CACHE_FILENAME),
+    ):
+        print(f"{Fore.CYAN}{Style.BRIGHT}{label}:{Style.RESET_ALL}")
+        if not cache_file.exists():
+            print(f"   {Fore.YELLOW}Empty{Style.RESET_ALL}\n")
+            continue
+        cache = EmbeddingCache(cache_file, embedder.name)
+        try:
+            cache_stats = cache.stats()
+        finally:
+            cache.close()
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        hit_rate = cache_stats["hits"] / lookups * 100 if lookups else 0.0
+        print(f"   Entries: {cache_stats['entries']}")
+        print(
+            f"   Hits: {cache_stats['hits']}  Misses: {cache_stats['misses']}  Hit rate: {hit_rate:.1f}%\n"
+        )
 
 
 @command()
 def clear() -> None:
     """
-    Clear the caches and the ChromaDB collection.
+    Clear the caches and the vector store.
     """
     print(f"{Style.BRIGHT}🧹 Clearing all caches and database...{Style.RESET_ALL}\n")
     try:
         with Spinner("Clearing database and caches"):
             chroma.clear()
-            save_file_cache({})
-            save_snippet_cache({})
+            state = get_index_state()
+            state.clear()
+            state.close()
         print(f"{Fore.GREEN}✅ All data cleared successfully!{Style.RESET_ALL}\n")
     except RuntimeError as e:
         print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
         return
 
 
-def process_file_snippets(
-    file_path: str,
-    file_content: str,
-    snippet_cache: dict[str, str],
-    new_snippet_cache: dict[str, str],
-) -> list[Snippet]:
-    file_snippets = extract_snippets(file_path, file_content)
+def snippet_cache_entry(snippet: Snippet) -> dict[str, Any]:
+    """
+    Snippet cache record: the code hash plus the snippet's current location.
+    """
+    return {
+        "hash": xxh3_64_hexdigest(snippet.code),
+        "line_start": snippet.line_start,
+        "line_end": snippet.line_end,
+    }
+
+
+def diff_snippets(
+    file_snippets: list[Snippet],
+    snippet_cache: dict[str, dict],
+    new_snippet_cache: dict[str, dict],
+) -> tuple[list[Snippet], list[Snippet]]:
+    """
+    Compare a file's snippets against the snippet cache.
+    Returns (snippets, moved_snippets): snippets whose code is new or changed,
+    and unchanged snippets that only moved to different lines.
+    """
     snippets: list[Snippet] = []
+    moved_snippets: list[Snippet] = []
     for snippet in file_snippets:
-        snippet_hash = xxh3_64_hexdigest(snippet.code)
-        if (
-            snippet.id in snippet_cache
-            and snippet_cache.get(snippet.id) == snippet_hash
-        ):
-            new_snippet_cache[snippet.id] = snippet_hash
-            del snippet_cache[snippet.id]
-        else:
-            new_snippet_cache[snippet.id] = snippet_hash
+        entry = snippet_cache_entry(snippet)
+        cached = snippet_cache.pop(snippet.id, None)
+        new_snippet_cache[snippet.id] = entry
+        if not isinstance(cached, dict) or cached.get("hash") != entry["hash"]:
             snippets.append(snippet)
-    return snippets
+        elif cached != entry:
+            moved_snippets.append(snippet)
+    return snippets, moved_snippets
+
+
+def hash_and_extract(
+    file: Path, project_root: Path, cached_hash: Optional[str]
+) -> tuple[str, str, Optional[list[Snippet]]]:
+    """
+    Read and hash a file, extracting its snippets only if the hash differs
+    from `cached_hash`. Runs in pool workers, so it must not touch shared state.
+    Returns (file_path, file_hash, file_snippets or None if unchanged)
+    """
+    with profiler.stage("read", 1) as counts:
+        file_content = read_file(file)
+        counts.bytes = len(file_content)
+    file_path = str(file.relative_to(project_root))
+    with profiler.stage("hash", 1, len(file_content)):
+        file_hash = xxh3_64_hexdigest(file_content)
+    if file_hash == cached_hash:
+        return file_path, file_hash, None
+    with profiler.stage("extract", bytes=len(file_content)) as counts:
+        file_snippets = extract_snippets(file_path, file_content)
+        counts.items = len(file_snippets)
+    return file_path, file_hash, file_snippets
+
+
+def profiled_hash_and_extract(
+    file: Path, project_root: Path, cached_hash: Optional[str]
+) -> tuple[tuple[str, str, Optional[list[Snippet]]], list]:
+    """
+    `hash_and_extract` for pool workers while profiling: also returns the
+    worker's stage records, for the parent to merge into its own.
+    """
+    return hash_and_extract(file, project_root, cached_hash), profiler.drain()
+
+
+def parse_python_files(
+    files: list[Path],
+    project_root: Path,
+    file_cache: dict,
+    jobs: int,
+    progress: ProgressBar,
+    verify: bool = False,
+    changed_files: Optional[set[str]] = None,
+) -> Iterator[tuple[str, dict[str, Any], Optional[list[Snippet]]]]:
+    """
+    Stat every file and run `hash_and_extract` over those whose stat signature
+    no longer matches the file cache (or all of them with `verify`), across
+    `jobs` worker processes. With `changed_files`, cached files outside that
+    set are taken as unchanged without even a stat.
+    Results are yielded in the order of `files` as soon as they are ready,
+    with at most a few files per worker in flight, so the caller can embed
+    early files while later ones are parsed and memory does not grow with
+    the project.
+    Yields (file_path, file_cache_entry, file_snippets or None if unchanged)
+    """
+    # (file_path, cached entry, stat or None if taken as unchanged) per file
+    plan: list[tuple[str, Any, Optional[os.stat_result]]] = []
+    with profiler.stage("stat", len(files)):
+        for file in files:
+            file_path = str(file.relative_to(project_root))
+            cached = file_cache.get(file_path)
+            if changed_files is not None and cached is not None and file_path not in changed_files:
+                plan.append((file_path, cached, None))
+                continue
+            stat = file.stat()
+            unchanged = not verify and stat_matches(cached, stat)
+            plan.append((file_path, cached, None if unchanged else stat))
+    pending = [i for i, (_, _, stat) in enumerate(plan) if stat is not None]
+
+    def finish(
+        i: int, result: tuple[str, str, Optional[list[Snippet]]]
+    ) -> tuple[str, dict[str, Any], Optional[list[Snippet]]]:
+        file_path, file_hash, file_snippets = result
+        if file_snippets is None:
+            progress.update(item_name=f"{files[i].name} (cached)")
+        else:
+            progress.update(item_name=f"{files[i].name} ({len(file_snippets)} snippets)")
+        return file_path, file_cache_entry(file_hash, plan[i][2]), file_snippets
+
+    if jobs <= 1 or len(pending) <= 1:
+        for i, (file_path, cached, stat) in enumerate(plan):
+            if stat is None:
+                progress.update(item_name=f"{files[i].name} (cached)")
+                yield file_path, cached, None
+            else:
+                yield finish(i, hash_and_extract(files[i], project_root, cached_file_hash(cached)))
+        return
+
+    import multiprocessing
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    # Worker processes send their stage timings back with each result
+    profiling = profiler.enabled
+    worker = profiled_hash_and_extract if profiling else hash_and_extract
+    window = jobs * PARSE_FILES_IN_FLIGHT_PER_JOB
+    # Spawned rather than forked: this runs while the indexing pipeline's
+    # threads are running, and forking a multi-threaded process is unsafe
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(pending)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=start_profiled_worker if profiling else None,
+    ) as executor:
+        futures: dict[int, Future] = {}
+        submitted = 0
+        for i, (file_path, cached, stat) in enumerate(plan):
+            if stat is None:
+                progress.update(item_name=f"{files[i].name} (cached)")
+                yield file_path, cached, None
+                continue
+            while submitted < len(pending) and len(futures) < window:
+                j = pending[submitted]
+                futures[j] = executor.submit(
+                    worker, files[j], project_root, cached_file_hash(plan[j][1])
+                )
+                submitted += 1
+            result = futures.pop(i).result()
+            if profiling:
+                result, records = result
+                profiler.merge(records)
+            yield finish(i, result)
+
+
+def git_changes(
+    root: Path, state: IndexState
+) -> tuple[Optional[set[str]], Optional[str], set[str]]:
+    """
+    Ask git which Python files may differ from the index state: those changed
+    since the commit recorded by the last `--git` run, untracked ones, and
+    those that were uncommitted at that run.
+    Returns (paths to check, or None to check every file; the HEAD commit, or
+    None outside a git repository; paths that differ from HEAD now)
+    """
+    head = git_repo.head_commit(root)
+    untracked = git_repo.untracked_paths(root) if head else None
+    modified = git_repo.changed_paths(root, head) if head else None
+    if untracked is None or modified is None:
+        return None, None, set()
+    dirty = modified | untracked
+    last_commit = state.get_text_meta(GIT_COMMIT_META)
+    if last_commit is None:
+        return None, head, dirty
+    since_last = modified if last_commit == head else git_repo.changed_paths(root, last_commit)
+    if since_last is None:
+        # The recorded commit is gone, e.g. after a rebase and garbage collection
+        return None, head, dirty
+    last_dirty = json.loads(state.get_text_meta(GIT_DIRTY_META) or "[]")
+    return since_last | untracked | set(last_dirty), head, dirty
+
+
+def set_git_state(state: IndexState, head: Optional[str], dirty_files: set[str]) -> None:
+    """
+    Record the commit and uncommitted files a `--git` run indexed, or forget
+    them after any other run, whose changes git cannot account for.
+    """
+    state.set_text_meta(GIT_COMMIT_META, head)
+    state.set_text_meta(GIT_DIRTY_META, json.dumps(sorted(dirty_files)) if head else None)
+
+
+class FileRecord:
+    """
+    The index state changes of a processed file: its new file cache entry and,
+    if its snippets were extracted, their new snippet cache entries.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        file_entry: dict[str, Any],
+        cached_entry: Optional[dict[str, Any]],
+        snippet_entries: Optional[dict[str, dict]],
+    ) -> None:
+        self.file_path = file_path
+        self.file_entry = file_entry
+        self.cached_entry = cached_entry
+        self.snippet_entries = snippet_entries
+
+    def apply(self, state: IndexState) -> None:
+        if self.file_entry != self.cached_entry:
+            state.set_file(self.file_path, self.file_entry)
+        if self.snippet_entries is not None:
+            state.set_file_snippets(self.file_path, self.snippet_entries)
+
+
+class IndexBatch:
+    """
+    Changes to the database on their way through the indexing pipeline: new
+    or changed snippets to embed and add, snippets that only moved, and IDs
+    of snippets that disappeared. It also carries the index state changes of
+    the files whose database changes are complete once it is written (and
+    of deleted files), which are committed only then.
+    """
+
+    def __init__(self) -> None:
+        self.snippets: list[Snippet] = []
+        self.moved_snippets: list[Snippet] = []
+        self.stale_snippet_ids: list[str] = []
+        self.embeddings: list[list[float]] = []
+        # Waits for `embeddings` while they are being computed
+        self.pending_embeddings: Optional[Callable[[], list[list[float]]]] = None
+        self.files: list[FileRecord] = []
+        self.removed_files: list[str] = []
+        # Number of new snippets up to and including each file in `files`
+        self.file_ends: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.snippets) + len(self.moved_snippets) + len(self.stale_snippet_ids)
+
+    def empty(self) -> bool:
+        return not (len(self) or self.files or self.removed_files)
+
+    def completed_files(self) -> int:
+        """
+        Number of leading files none of whose new snippets are still waiting
+        in this batch, which `take(0)` splits off.
+        """
+        return sum(1 for end in self.file_ends if end <= 0)
+
+    def extend(
+        self,
+        record: Optional[FileRecord],
+        snippets: list[Snippet],
+        moved_snippets: list[Snippet],
+        stale_snippet_ids: list[str],
+    ) -> None:
+        self.snippets.extend(snippets)
+        self.moved_snippets.extend(moved_snippets)
+        self.stale_snippet_ids.extend(stale_snippet_ids)
+        if record is not None:
+            self.files.append(record)
+            self.file_ends.append(len(self.snippets))
+
+    def take(self, size: int) -> "IndexBatch":
+        """
+        Split off a batch with up to `size` new snippets, every moved and
+        stale one, and the files all of whose new snippets it holds; the
+        rest stays in this batch.
+        """
+        batch = IndexBatch()
+        size = min(size, len(self.snippets))
+        batch.snippets, self.snippets = self.snippets[:size], self.snippets[size:]
+        batch.moved_snippets, self.moved_snippets = self.moved_snippets, []
+        batch.stale_snippet_ids, self.stale_snippet_ids = self.stale_snippet_ids, []
+        done = sum(1 for end in self.file_ends if end <= size)
+        batch.files, self.files = self.files[:done], self.files[done:]
+        batch.removed_files, self.removed_files = self.removed_files, []
+        self.file_ends = [end - size for end in self.file_ends[done:]]
+        return batch
+
+
+def embed_batch(batch: IndexBatch, batch_size: int) -> IndexBatch:
+    """
+    First pipeline stage: start embedding the batch's new snippets.
+    """
+    if batch.snippets:
+        batch.pending_embeddings = chroma.submit_embed(
+            [s.get_embedding_text() for s in batch.snippets], batch_size
+        )
+    return batch
+
+
+def collect_embeddings(batch: IndexBatch) -> IndexBatch:
+    """
+    Second pipeline stage: wait for the batch's embeddings. With embedding
+    workers, the batches queued before this stage are computed meanwhile.
+    """
+    if batch.pending_embeddings is not None:
+        batch.embeddings = batch.pending_embeddings()
+        batch.pending_embeddings = None
+    return batch
+
+
+def write_batch(batch: IndexBatch) -> IndexBatch:
+    """
+    Last pipeline stage: apply the batch to the vector store and the
+    lexical index.
+    """
+    if batch.stale_snippet_ids:
+        chroma.delete(ids=batch.stale_snippet_ids)
+    if batch.moved_snippets:
+        chroma.update_metadata(batch.moved_snippets)
+    if batch.snippets:
+        chroma.upsert(batch.snippets, batch.embeddings)
+    # Only the index state changes are still needed, for the checkpoint
+    batch.snippets, batch.moved_snippets, batch.embeddings = [], [], []
+    return batch
+
+
+def checkpoint(state: IndexState, batches: list[IndexBatch]) -> None:
+    """
+    Record the files of batches that were written to the database in the
+    index state and commit it, so an interrupted run resumes after the last
+    written batch instead of starting over.
+    """
+    if not batches:
+        return
+    with profiler.stage("state.checkpoint", sum(len(b.files) for b in batches)):
+        for batch in batches:
+            for record in batch.files:
+                record.apply(state)
+            state.remove_files(batch.removed_files)
+        state.commit()
+
+
+def reset_if_store_empty(state: IndexState) -> None:
+    """
+    Forget the recorded files when the vector store has no records but the
+    state says snippets were indexed (e.g. after `loca set-store`), so that
+    every snippet is added again. Their embeddings come from the cache.
+    Conversely, empty the store when the state records no snippets but the
+    store has some (e.g. after outdated caches were dropped on upgrade):
+    their IDs are unknown, so they would never be deleted and would show up
+    next to the re-added snippets.
+    """
+    recorded, stored = state.counts()[1], chroma.count()
+    if recorded and stored == 0:
+        state.clear()
+    elif stored and recorded == 0:
+        chroma.clear_records()
+
+
+def migrate_store_layout(state: IndexState, batch_size: int) -> None:
+    """
+    Rewrite the stored records once if they were written in an older layout
+    or with another compression codec than the configured one. If the state
+    was recorded against the other store backend, whose store may hold
+    records from an earlier switch that missed every change since, empty
+    this store and forget the recorded files instead, so that every snippet
+    is added again with embeddings from the cache.
+    """
+    layout = chroma.layout()
+    recorded = state.get_text_meta(STORE_LAYOUT_META)
+    if recorded == layout:
+        return
+    if recorded and recorded.split(":")[0] != get_store_backend():
+        chroma.clear_records()
+        state.clear()
+    elif chroma.count():
+        with Spinner("Migrating stored snippets"):
+            migrated = chroma.migrate_layout(batch_size)
+        print(f"{Fore.GREEN}✔ Migrated {migrated} stored snippets to the current layout{Style.RESET_ALL}\n")
+    state.set_text_meta(STORE_LAYOUT_META, layout)
+    state.commit()
+
+
+def is_extraction_outdated(state: IndexState) -> bool:
+    """
+    Check whether the recorded snippets were extracted by an older version.
+    """
+    return state.get_meta("extractor_version") != EXTRACTOR_VERSION
+
+
+def diff_file(
+    state: IndexState,
+    file_path: str,
+    file_entry: dict[str, Any],
+    cached_entry: Optional[dict[str, Any]],
+    file_snippets: Optional[list[Snippet]],
+) -> tuple[Optional[FileRecord], list[Snippet], list[Snippet], list[str]]:
+    """
+    Compare a processed file with the index state without changing it.
+    Unchanged files (no snippets) only need their stat signature refreshed.
+    Returns (record to apply once the database is updated, or None if there
+    is nothing to record; snippets, moved_snippets, stale_snippet_ids): new
+    or changed snippets, snippets that only moved, and IDs of snippets that
+    disappeared.
+    """
+    if file_snippets is None:
+        if file_entry == cached_entry:
+            return None, [], [], []
+        return FileRecord(file_path, file_entry, cached_entry, None), [], [], []
+    old_snippet_cache = state.get_file_snippets(file_path)
+    new_snippet_cache: dict[str, dict] = {}
+    snippets, moved_snippets = diff_snippets(
+        file_snippets, old_snippet_cache, new_snippet_cache
+    )
+    record = FileRecord(file_path, file_entry, cached_entry, new_snippet_cache)
+    return record, snippets, moved_snippets, list(old_snippet_cache)
+
+
+def record_file(
+    state: IndexState,
+    file_path: str,
+    file_entry: dict[str, Any],
+    cached_entry: Optional[dict[str, Any]],
+    file_snippets: Optional[list[Snippet]],
+) -> tuple[list[Snippet], list[Snippet], list[str]]:
+    """
+    Record a processed file in the index state right away (see `diff_file`).
+    Returns (snippets, moved_snippets, stale_snippet_ids)
+    """
+    record, snippets, moved_snippets, stale_snippet_ids = diff_file(
+        state, file_path, file_entry, cached_entry, file_snippets
+    )
+    if record is not None:
+        record.apply(state)
+    return snippets, moved_snippets, stale_snippet_ids
 
 
 def process_python_file(
     file: Path,
-    file_cache: dict,
-    snippet_cache: dict,
-    new_snippet_cache: dict,
+    state: IndexState,
     project_root: Path,
-) -> tuple[bool, list[Snippet], str]:
+    verify: bool = False,
+    force: bool = False,
+) -> tuple[bool, list[Snippet], list[Snippet], list[str]]:
     """
-    Process a single Python file: hash, extract snippets, update caches.
-    Returns (is_cached, file_snippets, file_hash)
+    Process a single Python file: stat, hash, extract snippets, update the
+    index state. The file is not opened when its stat signature matches the
+    recorded one, unless `verify` is set; `force` re-extracts it even if its
+    content is unchanged.
+    Returns (is_cached, file_snippets, moved_snippets, stale_snippet_ids)
     """
-    file_content = read_file(file)
     file_path = str(file.relative_to(project_root))
-    file_hash = xxh3_64_hexdigest(file_content)
-    if file_path in file_cache and file_cache.get(file_path) == file_hash:
-        new_snippet_cache[file_path] = file_hash
-        return True, [], file_hash
-    else:
-        new_snippet_cache[file_path] = file_hash
-        file_snippets = process_file_snippets(
-            file_path, file_content, snippet_cache, new_snippet_cache
+    stat = file.stat()
+    cached = state.get_file(file_path)
+    if not (verify or force) and stat_matches(cached, stat):
+        return True, [], [], []
+    _, file_hash, file_snippets = hash_and_extract(
+        file, project_root, None if force else cached_file_hash(cached)
+    )
+    snippets, moved_snippets, stale_snippet_ids = record_file(
+        state, file_path, file_cache_entry(file_hash, stat), cached, file_snippets
+    )
+    return file_snippets is None, snippets, moved_snippets, stale_snippet_ids
+
+
+def reindex_files(
+    files: list[Path],
+    deleted_files: set[Path],
+    project_root: Path,
+    state: IndexState,
+    batch_size: int,
+    force: bool = False,
+) -> None:
+    """
+    Incrementally reindex a subset of the project, updating the database and
+    committing the index state. Files that fail to parse (e.g. half-saved)
+    keep their previous snippets until the next change.
+    """
+    start = time.time()
+    stale_snippet_ids: list[str] = []
+    snippets: list[Snippet] = []
+    moved_snippets: list[Snippet] = []
+    changed_count = len(deleted_files)
+
+    for file in files:
+        file_path = str(file.relative_to(project_root))
+        try:
+            is_cached, file_snippets, file_moved, file_stale = process_python_file(
+                file, state, project_root, force=force
+            )
+        except (OSError, SyntaxError, UnicodeDecodeError) as e:
+            print(f"{Fore.YELLOW}⚠️  Skipping {file_path}: {e}{Style.RESET_ALL}")
+            continue
+        if not is_cached:
+            changed_count += 1
+            snippets.extend(file_snippets)
+            moved_snippets.extend(file_moved)
+            stale_snippet_ids.extend(file_stale)
+
+    update_database(
+        state,
+        stale_snippet_ids,
+        {str(f.relative_to(project_root)) for f in deleted_files},
+        chroma,
+    )
+    if moved_snippets:
+        chroma.update_metadata(moved_snippets)
+    if snippets:
+        chroma.add(snippets, batch_size)
+    if changed_count:
+        set_git_state(state, None, set())
+    with profiler.stage("state.commit"):
+        state.commit()
+
+    if changed_count:
+        print(
+            f"{Fore.GREEN}✔ [{time.strftime('%H:%M:%S')}] Reindexed {changed_count} files, {len(snippets)} new/updated snippets in {time.time() - start:.2f}s{Style.RESET_ALL}"
         )
-        return False, file_snippets, file_hash
 
 
 def update_database(
-    snippet_cache, new_snippet_cache, un_updated_files_prefixes, chroma
+    state: IndexState, stale_snippet_ids: list[str], deleted_files: set[str], chroma
 ) -> None:
     """
-    Update the database: remove old snippets, add new ones.
+    Update the database: remove snippets that disappeared from changed files
+    and all snippets of deleted files.
     """
-    old_snippets = snippet_cache.keys() - new_snippet_cache.keys()
-    for old_snippet_key in list(old_snippets):
-        if starts_with_any(old_snippet_key, un_updated_files_prefixes):
-            val = snippet_cache.get(old_snippet_key)
-            old_snippets.remove(old_snippet_key)
-            new_snippet_cache[old_snippet_key] = val
+    with profiler.stage("state.remove", len(deleted_files)):
+        old_snippets = [*stale_snippet_ids, *state.remove_files(deleted_files)]
     if old_snippets:
         with Spinner(f"Removing {len(old_snippets)} old snippets"):
-            chroma.delete(ids=list(old_snippets))
+            chroma.delete(ids=old_snippets)
 
 
-def save_caches_and_print(
-    new_file_cache, new_snippet_cache, python_files, snippets
+def save_state_and_print(
+    state: IndexState, python_files: list[Path], snippet_count: int
 ) -> None:
     """
-    Save caches and print the final summary message.
+    Commit the index state and print the final summary message.
     """
-    with Spinner("Saving caches"):
-        save_file_cache(new_file_cache)
-        save_snippet_cache(new_snippet_cache)
+    with Spinner("Saving index state"), profiler.stage("state.commit"):
+        state.commit()
     print(
-        f"{Fore.GREEN}✅ Indexing complete! Processed {len(python_files)} files, found {len(snippets)} new/updated snippets.{Style.RESET_ALL}\n"
+        f"{Fore.GREEN}✅ Indexing complete! Processed {len(python_files)} files, found {snippet_count} new/updated snippets.{Style.RESET_ALL}\n"
     )
 
 
-def print_results(q: str, results: QueryResult) -> None:
+def index_all_roots(
+    jobs: int, verify: bool, git: bool, embed_workers: Optional[int] = None
+) -> Optional[int]:
+    """
+    Index every registered root concurrently, each in its own `loca index`
+    process, splitting the `jobs` and `embed_workers` budgets between them.
+    """
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    roots = get_registered_roots()
+    if not roots:
+        print(f"{Fore.RED}❌ No project roots registered. Use `loca set-root` or `loca add-root`.{Style.RESET_ALL}\n")
+        return 1
+    concurrency = min(len(roots), jobs)
+    # The batch size reaches the children through the config; passing it
+    # would make each child rewrite the config file at the same time
+    args = [sys.executable, "-m", "loca.cli", "index", "--jobs", str(max(1, jobs // concurrency))]
+    if verify:
+        args.append("--verify")
+    if git:
+        args.append("--git")
+    if embed_workers:
+        args.extend(["--embed-workers", str(max(1, embed_workers // concurrency))])
+    print(
+        f"{Style.BRIGHT}📁 Indexing {len(roots)} project roots, {concurrency} at a time{Style.RESET_ALL}\n"
+    )
+
+    def run(root: Path) -> "subprocess.CompletedProcess[str]":
+        return subprocess.run(
+            args, cwd=root, capture_output=True, text=True, encoding="utf-8", errors="replace"
+        )
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run, root): root for root in roots if root.is_dir()}
+        for root in roots:
+            if not root.is_dir():
+                failed = True
+                print(f"{Fore.RED}❌ {root}: directory not found{Style.RESET_ALL}")
+        for future in as_completed(futures):
+            result = future.result()
+            # The last line the child printed is its summary or its error
+            lines = [
+                line.strip()
+                for line in (result.stdout + result.stderr).replace("\r", "\n").splitlines()
+                if line.strip()
+            ]
+            summary = lines[-1] if lines else ""
+            if result.returncode == 0 and "❌" not in summary:
+                print(f"{Fore.GREEN}✔ {futures[future]}{Style.RESET_ALL}: {summary}")
+            else:
+                failed = True
+                print(f"{Fore.RED}❌ {futures[future]}{Style.RESET_ALL}: {summary}")
+    print()
+    return 1 if failed else None
+
+
+def query_all_roots(
+    q: Optional[str],
+    n_results: int,
+    mode: str,
+    batch: Optional[str],
+    filters: dict[str, Optional[str]],
+) -> Optional[int]:
+    """
+    Search every registered root at once and print the merged results.
+    """
+    if batch is not None or not q:
+        print(f"{Fore.RED}❌ --all needs a single query and cannot be combined with --batch.{Style.RESET_ALL}\n")
+        sys.exit(1)
+    roots = [root for root in get_registered_roots() if root.is_dir()]
+    if not roots:
+        print(f"{Fore.RED}❌ No project roots registered. Use `loca set-root` or `loca add-root`.{Style.RESET_ALL}\n")
+        return 1
+    print(f"{Style.BRIGHT}🔍 Searching {len(roots)} project roots for: {q}{Style.RESET_ALL}\n")
+    try:
+        with Spinner("Searching databases"):
+            results = chroma.query_all(q, roots, n_results, mode, **filters)
+    except RuntimeError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}\n")
+        return 1
+    print_results(q, results)
+
+
+def read_batch_queries(lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+    """
+    Parse batch query input: one query per line, either plain text or a JSON
+    object with a "q" field (other fields are echoed back with the results).
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            yield {"q": line}
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON ({e.msg})") from e
+        if not isinstance(item.get("q"), str) or not item["q"]:
+            raise ValueError(f'Line {line_number}: expected a non-empty "q" field')
+        yield item
+
+
+def batch_query(
+    batch: str, n_results: int, mode: str, filters: dict[str, Optional[str]]
+) -> Optional[int]:
+    """
+    Answer every query in `batch` (a file path, or "-" for stdin) and stream
+    one JSON line per query to stdout. Queries are sent in chunks of the
+    configured batch size, each answered with one batched encode and one
+    multi-vector search.
+    """
+    try:
+        stream = sys.stdin if batch == "-" else open(batch, encoding="utf-8")
+    except OSError as e:
+        print(f"{Fore.RED}❌ Cannot read batch file: {e}{Style.RESET_ALL}", file=sys.stderr)
+        return 1
+    try:
+        with stream:
+            for items in batched(read_batch_queries(stream), get_batch_size()):
+                qs = [item["q"] for item in items]
+                results = server.request(
+                    "batch_query", qs=qs, n_results=n_results, mode=mode, **filters
+                )
+                if results is None:
+                    results = chroma.batch_query(qs, n_results, mode, **filters)
+                for item, result in zip(items, results):
+                    print(json.dumps({**item, "results": result_records(result)}), flush=True)
+    except (ValueError, RuntimeError) as e:
+        print(f"{Fore.RED}❌ {e}{Style.RESET_ALL}", file=sys.stderr)
+        return 1
+
+
+def result_records(results: "QueryResult") -> list[dict[str, Any]]:
+    """
+    Flatten a single-query result into one record per snippet.
+    """
+    return [
+        {"id": id_, "document": doc, "metadata": meta}
+        for id_, doc, meta in zip(
+            results.get("ids", [[]])[0],
+            results.get("documents", [[]])[0],
+            results.get("metadatas", [[]])[0],
+        )
+    ]
+
+
+def print_results(q: str, results: "QueryResult") -> None:
     """
     Print the results of the query in a formatted way.
     """
@@ -220,6 +1225,10 @@ def print_results(q: str, results: QueryResult) -> None:
         return
     for idx, (id_, doc, meta) in enumerate(zip(ids, docs, metadatas), 1):
         print(f"{Fore.CYAN}{Style.BRIGHT}{idx}. {id_}{Style.RESET_ALL}")
+        if meta.get("line_start"):
+            print(
+                f"   {Fore.BLUE}Lines: {meta['line_start']}-{meta['line_end']}{Style.RESET_ALL}"
+            )
         print(f"{Fore.WHITE}{doc}{Style.RESET_ALL}")
         if meta.get("name"):
             print(f"   {Fore.MAGENTA}Name: {meta['name']}{Style.RESET_ALL}")
@@ -0,0 +1,67 @@
+import base64
+import zlib
+
+from .config import load_config
+from .constants import COMPRESSION_KEY, DEFAULT_COMPRESSION, DOCUMENT_CODECS
+
+# Compressed documents are stored as this marker, the codec name, ":" and the
+# base85 of the compressed code. Python source never starts with the marker,
+# so plain and compressed documents can be told apart and mixed freely.
+_MARKER = "\x01"
+
+
+def get_compression() -> str:
+    """
+    Get the codec used to compress stored code from the configuration, or the default.
+    """
+    codec = load_config().get(COMPRESSION_KEY, DEFAULT_COMPRESSION)
+    return codec if codec in DOCUMENT_CODECS else DEFAULT_COMPRESSION
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError(
+            "❌ zstd compression needs the zstandard package. Install it with `pip install loca[zstd]`."
+        ) from None
+    return zstandard
+
+
+def check_codec(codec: str) -> None:
+    """
+    Raise a RuntimeError if `codec` needs a package that is not installed.
+    """
+    if codec == "zstd":
+        _zstd()
+
+
+def encode_document(code: str, codec: str) -> str:
+    """
+    Encode the code of a snippet for storage, compressed with `codec` unless
+    that would not make it shorter.
+    """
+    if codec == "none":
+        return code
+    data = code.encode("utf-8")
+    if codec == "zstd":
+        compressed = _zstd().ZstdCompressor().compress(data)
+    else:
+        compressed = zlib.compress(data, 9)
+    document = f"{_MARKER}{codec}:{base64.b85encode(compressed).decode('ascii')}"
+    return document if len(document) < len(code) else code
+
+
+def decode_document(document: str) -> str:
+    """
+    Return the code stored as `document`, whichever codec wrote it.
+    """
+    if not document.startswith(_MARKER):
+        return document
+    codec, _, body = document[1:].partition(":")
+    data = base64.b85decode(body)
+    if codec == "zstd":
+        data = _zstd().ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
@@ -0,0 +1,310 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .config import load_config
+from .constants import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_EMBEDDER,
+    EMBEDDER_KEY,
+    EMBEDDING_MODEL_NAME,
+    ONNX_MAX_SEQ_LENGTH,
+    ONNX_MODEL_DIR_KEY,
+)
+from .profiler import profiler
+from .utils import batched
+
+
+class Embedder:
+    """
+    Turns texts into embedding vectors. Backends load their model lazily on
+    first use, so constructing one never imports torch or onnxruntime.
+    """
+
+    # Identifies the vector space; cached embeddings are keyed by it
+    name: str = ""
+
+    def load(self) -> None:
+        """
+        Load the model now instead of on the first `encode`.
+        """
+
+    def encode(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> list[list[float]]:
+        raise NotImplementedError
+
+    def submit(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Callable[[], list[list[float]]]:
+        """
+        Start encoding texts and return a function that waits for the vectors.
+        Backends running in this process encode right away.
+        """
+        vectors = self.encode(texts, batch_size)
+        return lambda: vectors
+
+    def close(self) -> None:
+        """
+        Release resources held beyond the model, such as worker processes.
+        """
+
+
+class TorchEmbedder(Embedder):
+    """
+    SentenceTransformer on torch. With `quantize`, the linear layers are
+    dynamically quantized to int8, which runs on the CPU only. `threads`
+    pins torch's intra-op thread count.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        quantize: bool = False,
+        threads: Optional[int] = None,
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.threads = threads
+        self.name = f"{model_name}:int8" if quantize else model_name
+        self._model: Optional[Any] = None
+
+    def load(self) -> None:
+        if self._model is not None:
+            return
+        from sentence_transformers import SentenceTransformer
+        import torch
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        if self.quantize:
+            model = SentenceTransformer(self.model_name, device="cpu")
+            # torch.ao.quantization is only there from torch 1.10 on
+            quantization = torch.ao.quantization if hasattr(torch, "ao") else torch.quantization
+            self._model = quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        else:
+            self._model = SentenceTransformer(
+                self.model_name,
+                device="cuda" if torch.cuda.is_available() else "cpu",
+            )
+
+    def encode(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> list[list[float]]:
+        self.load()
+        if not profiler.enabled:
+            return self._model.encode(texts, batch_size=batch_size).tolist()
+        # Encode batch by batch so that each batch's size, tokens and time are recorded
+        vectors: list[list[float]] = []
+        for batch in batched(texts, batch_size):
+            tokens = int(self._model.tokenize(batch)["attention_mask"].sum())
+            start = time.perf_counter()
+            vectors.extend(self._model.encode(batch, batch_size=batch_size).tolist())
+            profiler.record_batch(len(batch), tokens, time.perf_counter() - start)
+        return vectors
+
+
+class OnnxEmbedder(Embedder):
+    """
+    A transformer exported to ONNX, run with ONNX Runtime on the CPU.
+    `model_dir` holds `model.onnx` (or `onnx/model.onnx`) and `tokenizer.json`;
+    token embeddings are mean-pooled and normalized like the sentence-transformers
+    model they were exported from. `threads` pins ONNX Runtime's intra-op
+    thread count.
+    """
+
+    def __init__(self, model_dir: str, threads: Optional[int] = None):
+        self.model_dir = Path(model_dir).expanduser().resolve() if model_dir else None
+        self.threads = threads
+        self.name = f"onnx:{self.model_dir}"
+        self._session: Optional[Any] = None
+        self._tokenizer: Optional[Any] = None
+
+    @staticmethod
+    def find_model(model_dir: Path) -> Optional[Path]:
+        """
+        Return the ONNX model file inside `model_dir`, or None.
+        """
+        for candidate in (model_dir / "model.onnx", model_dir / "onnx" / "model.onnx"):
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def load(self) -> None:
+        if self._session is not None:
+            return
+        model_path = self.find_model(self.model_dir) if self.model_dir else None
+        tokenizer_path = self.model_dir / "tokenizer.json" if self.model_dir else None
+        if model_path is None or not tokenizer_path.is_file():
+            raise RuntimeError(
+                "❌ ONNX model not found. Run `loca set-embedder onnx --model-dir DIR` "
+                "with a directory containing model.onnx and tokenizer.json."
+            )
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise RuntimeError(
+                "❌ The onnx backend needs the onnxruntime and tokenizers packages. Install them with `pip install loca[onnx]`."
+            ) from None
+
+        tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        if tokenizer.padding is None:
+            tokenizer.enable_padding()
+        tokenizer.enable_truncation(max_length=self._max_seq_length())
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self._session = onnxruntime.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self._tokenizer = tokenizer
+
+    def _max_seq_length(self) -> int:
+        # Match the truncation the sentence-transformers model was trained with
+        try:
+            with open(self.model_dir / "sentence_bert_config.json", encoding="utf-8") as f:
+                return int(json.load(f).get("max_seq_length", ONNX_MAX_SEQ_LENGTH))
+        except (OSError, ValueError):
+            return ONNX_MAX_SEQ_LENGTH
+
+    def encode(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> list[list[float]]:
+        self.load()
+        import numpy as np
+
+        input_names = [model_input.name for model_input in self._session.get_inputs()]
+        output_names = [output.name for output in self._session.get_outputs()]
+        vectors: list[list[float]] = []
+        for batch in batched(texts, batch_size):
+            start = time.perf_counter()
+            encodings = self._tokenizer.encode_batch(batch)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": attention_mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            outputs = dict(
+                zip(
+                    output_names,
+                    self._session.run(None, {name: inputs[name] for name in input_names}),
+                )
+            )
+            if "sentence_embedding" in outputs:
+                pooled = outputs["sentence_embedding"]
+            else:
+                token_embeddings = outputs[output_names[0]]
+                mask = attention_mask[..., None].astype(token_embeddings.dtype)
+                pooled = (token_embeddings * mask).sum(axis=1) / np.clip(
+                    mask.sum(axis=1), 1e-9, None
+                )
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+            if profiler.enabled:
+                profiler.record_batch(
+                    len(batch), int(attention_mask.sum()), time.perf_counter() - start
+                )
+        return vectors
+
+
+# The embedder of a `PooledEmbedder` worker process
+_worker_embedder: Optional[Embedder] = None
+
+
+def _start_embed_worker(backend: Optional[str], threads: int, profiling: bool) -> None:
+    global _worker_embedder
+    if profiling:
+        profiler.start_worker()
+    _worker_embedder = get_embedder(backend, threads)
+
+
+def _encode_in_worker(
+    texts: list[str], batch_size: int
+) -> tuple[list[list[float]], list[tuple[int, Optional[int], float]]]:
+    vectors = _worker_embedder.encode(texts, batch_size)
+    return vectors, profiler.drain_batches()
+
+
+class PooledEmbedder(Embedder):
+    """
+    Runs another backend in `workers` processes, each with its own copy of
+    the model and `threads` intra-op threads, for CPUs that one process
+    cannot keep busy. Texts are split into one chunk per worker (at most
+    `batch_size` texts each) and the vectors are returned in order. Several
+    submitted batches can be in flight at once, so workers that finish their
+    chunk early start on the next batch instead of waiting for the slowest.
+    """
+
+    def __init__(self, backend: Optional[str], workers: int, threads: int) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.threads = threads
+        self.name = get_embedder(backend).name
+        self._executor: Optional[Any] = None
+
+    def load(self) -> None:
+        if self._executor is not None:
+            return
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Spawned rather than forked: the parent runs threads (the indexing
+        # pipeline), and neither torch nor ONNX Runtime survive a fork safely
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_start_embed_worker,
+            initargs=(self.backend, self.threads, profiler.enabled),
+        )
+
+    def encode(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> list[list[float]]:
+        return self.submit(texts, batch_size)()
+
+    def submit(
+        self, texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Callable[[], list[list[float]]]:
+        self.load()
+        chunk_size = min(batch_size, -(-len(texts) // self.workers)) or 1
+        futures = [
+            self._executor.submit(_encode_in_worker, chunk, batch_size)
+            for chunk in batched(texts, chunk_size)
+        ]
+
+        def result() -> list[list[float]]:
+            vectors: list[list[float]] = []
+            for future in futures:
+                chunk_vectors, batches = future.result()
+                vectors.extend(chunk_vectors)
+                profiler.merge_batches(batches)
+            return vectors
+
+        return result
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def get_embedder(backend: Optional[str] = None, threads: Optional[int] = None) -> Embedder:
+    """
+    Create the embedder for `backend`, or the one selected in the configuration,
+    optionally pinned to `threads` intra-op threads.
+    """
+    config = load_config()
+    backend = backend or config.get(EMBEDDER_KEY, DEFAULT_EMBEDDER)
+    if backend == "torch-int8":
+        return TorchEmbedder(quantize=True, threads=threads)
+    if backend == "onnx":
+        return OnnxEmbedder(config.get(ONNX_MODEL_DIR_KEY) or "", threads)
+    return TorchEmbedder(threads=threads)
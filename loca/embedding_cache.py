@@ -0,0 +1,189 @@
+import atexit
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import lazy_import
+
+from .constants import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PENDING_MAX
+
+
+xxh3_64_hexdigest = lazy_import.lazy_callable("xxhash.xxh3_64_hexdigest")
+
+
+def embedding_key(text: str) -> str:
+    """
+    Content address of an embedding input text.
+    """
+    return xxh3_64_hexdigest(text)
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded LRU store of embeddings keyed by the hash of the
+    text they were computed from. Entries are scoped to a model name, so
+    switching models never returns stale vectors. Lookups only read: the
+    hit/miss counters and recency of used entries are kept in memory and
+    written with the next `put_many`, in batches, or on close or exit.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        model_name: str,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.model_name = model_name
+        self.max_entries = max_entries
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Used from the embedding threads of the indexing pipeline, one at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.closed = False
+        self._used: dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        atexit.register(self.close)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, list[float]]:
+        """
+        Return the cached embeddings for the given keys, skipping misses.
+        Hits are marked as recently used.
+        """
+        with self.lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys: Iterable[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well below SQLite's host parameter limit
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                [self.model_name, *chunk],
+            )
+            found.update((key, _unpack(vector)) for key, vector in rows)
+        now = time.time_ns()
+        self._used.update((key, now) for key in found)
+        self._hits += len(found)
+        self._misses += len(unique_keys) - len(found)
+        if len(self._used) >= EMBEDDING_CACHE_PENDING_MAX:
+            self._write_pending()
+            self.conn.commit()
+        return found
+
+    def _write_pending(self) -> None:
+        """
+        Write the recorded recency and counters, without committing.
+        """
+        if self._used:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                [(used, self.model_name, key) for key, used in self._used.items()],
+            )
+        if self._hits or self._misses:
+            self.conn.executemany(
+                "INSERT INTO stats (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+                [("hits", self._hits), ("misses", self._misses)],
+            )
+        self._used, self._hits, self._misses = {}, 0, 0
+
+    def put_many(self, items: dict[str, Sequence[float]]) -> None:
+        """
+        Store embeddings, evicting the least recently used entries when the
+        cache grows beyond its size bound.
+        """
+        if not items:
+            return
+        with self.lock:
+            self._put_many(items)
+
+    def _put_many(self, items: dict[str, Sequence[float]]) -> None:
+        # Recency first, so that entries used since the last write are not evicted
+        self._write_pending()
+        now = time.time_ns()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, key, _pack(vector), now) for key, vector in items.items()],
+        )
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        self.conn.commit()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of cached entries and the lifetime hit/miss counts.
+        """
+        (entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        counters = dict(self.conn.execute("SELECT key, value FROM stats"))
+        return {
+            "entries": entries,
+            "hits": counters.get("hits", 0) + self._hits,
+            "misses": counters.get("misses", 0) + self._misses,
+        }
+
+    def clear(self) -> None:
+        with self.lock:
+            self._used, self._hits, self._misses = {}, 0, 0
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.execute("DELETE FROM stats")
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._used or self._hits or self._misses:
+                try:
+                    self._write_pending()
+                    self.conn.commit()
+                except sqlite3.Error:
+                    # Only bookkeeping is lost, e.g. if the cache was removed meanwhile
+                    pass
+            self.conn.close()
+        atexit.unregister(self.close)
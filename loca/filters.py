@@ -0,0 +1,62 @@
+from typing import Any, Callable, Optional
+
+from .constants import SNIPPET_TYPE_FILTERS
+
+# A ChromaDB-style metadata filter, e.g. {"$and": [{"type": "class"}, {"name": "A"}]}
+Where = dict[str, Any]
+
+
+def build_where(
+    snippet_type: Optional[str] = None,
+    path: Optional[str] = None,
+    name: Optional[str] = None,
+) -> Optional[Where]:
+    """
+    Build the metadata filter for `loca query --type/--path/--name`, or None
+    when nothing is filtered. The --path glob is kept as a `$glob` clause
+    (`*` also matches across directories, as in SQLite's GLOB).
+    """
+    clauses: list[Where] = []
+    if snippet_type:
+        clauses.append({"type": SNIPPET_TYPE_FILTERS.get(snippet_type, snippet_type)})
+    if path:
+        clauses.append({"file_path": {"$glob": path}})
+    if name:
+        clauses.append({"name": name})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def split_clause(where: Where) -> tuple[str, str, Any]:
+    """
+    Split a single-field filter ({field: value} or {field: {op: value}})
+    into its field, operator and value.
+    """
+    ((field, condition),) = where.items()
+    op, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+    return field, op, value
+
+
+def where_to_sql(where: Where, column: Callable[[str], str]) -> tuple[str, list[Any]]:
+    """
+    Translate the filters built by `build_where` ({field: value}, $eq, $in,
+    $glob and $and) into an SQL condition and its parameters, where `column(field)`
+    is the SQL expression holding a metadata field.
+    """
+    if "$and" in where:
+        parts = [where_to_sql(clause, column) for clause in where["$and"]]
+        return (
+            " AND ".join(f"({sql})" for sql, _ in parts),
+            [param for _, params in parts for param in params],
+        )
+    field, op, value = split_clause(where)
+    if op == "$eq":
+        return f"{column(field)} = ?", [value]
+    if op == "$in":
+        if not value:
+            return "0", []
+        return f"{column(field)} IN ({','.join('?' * len(value))})", list(value)
+    if op == "$glob":
+        return f"{column(field)} GLOB ?", [value]
+    raise ValueError(f"Unsupported filter operator: {op}")
@@ -0,0 +1,47 @@
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+
+def run_git(root: Path, *args: str) -> Optional[str]:
+    """
+    Run a git command in `root` and return its output, or None if git is not
+    installed, `root` is not in a repository or the command fails.
+    """
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=root, capture_output=True, text=True, encoding="utf-8"
+        )
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _paths(output: Optional[str]) -> Optional[set[str]]:
+    # NUL-separated paths (from -z), turned into native relative paths
+    if output is None:
+        return None
+    return {str(Path(path)) for path in output.split("\0") if path}
+
+
+def head_commit(root: Path) -> Optional[str]:
+    output = run_git(root, "rev-parse", "--verify", "-q", "HEAD^{commit}")
+    return output.strip() if output else None
+
+
+def changed_paths(root: Path, commit: str) -> Optional[set[str]]:
+    """
+    Python files below `root` whose working tree content differs from
+    `commit` (committed, staged or not), including deleted ones, relative to
+    `root`; None if the commit is unknown.
+    """
+    return _paths(
+        run_git(root, "diff", "--name-only", "-z", "--no-renames", "--relative", commit, "--", "*.py")
+    )
+
+
+def untracked_paths(root: Path) -> Optional[set[str]]:
+    """
+    Untracked, not ignored Python files below `root`, relative to `root`.
+    """
+    return _paths(run_git(root, "ls-files", "-z", "--others", "--exclude-standard", "--", "*.py"))
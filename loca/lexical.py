@@ -0,0 +1,233 @@
+import heapq
+import math
+import re
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .constants import BM25_B, BM25_K1, RRF_K
+from .filters import Where, where_to_sql
+from .snippet import Snippet
+
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+# Boundaries inside identifiers: lower→Upper ("getSnippet"), acronym→Word
+# ("HTTPServer") and letter↔digit ("xxh3")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def split_identifier(identifier: str) -> list[str]:
+    """
+    Split a snake_case or camelCase identifier into its lowercase parts.
+    """
+    parts = []
+    for chunk in identifier.split("_"):
+        parts.extend(part.lower() for part in CAMEL_RE.findall(chunk))
+    return parts
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lexical terms of a text: every identifier as a whole (so exact matches
+    like `get_snippet_cache` score highest) plus its snake/camel-case parts.
+    """
+    terms = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        whole = identifier.lower()
+        terms.append(whole)
+        parts = split_identifier(identifier)
+        if len(parts) > 1 or (parts and parts[0] != whole):
+            terms.extend(parts)
+    return terms
+
+
+def snippet_text(snippet: Snippet) -> str:
+    return " ".join(
+        [
+            Path(snippet.file_path).stem,
+            snippet.qualname,
+            snippet.name,
+            snippet.docstring,
+            snippet.code,
+        ]
+    )
+
+
+def reciprocal_rank_fusion(rankings: Iterable[list[str]], k: int = RRF_K) -> list[str]:
+    """
+    Merge several rankings of IDs into one, scoring each ID by the sum of
+    1 / (k + rank) over the rankings it appears in.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+class LexicalIndex:
+    """
+    On-disk inverted index over snippet identifiers, docstrings and code
+    tokens, scored with BM25. Kept in step with the vector collection by
+    adding and deleting snippets alongside it. Each document also keeps the
+    snippet's file path, type and name, so searches can be filtered in SQL.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Opened and used from different threads by `query_all`, never concurrently
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(docs)")}
+        if columns and "file_path" not in columns:
+            # Index from before filters: drop it, `sync_lexical_index` rebuilds it
+            self.conn.executescript(
+                "DROP TABLE docs; DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS stats;"
+            )
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                type TEXT NOT NULL,
+                name TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_file_path ON docs (file_path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def _stat(self, key: str) -> int:
+        row = self.conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_stat(self, key: str, delta: int) -> None:
+        self.conn.execute(
+            "INSERT INTO stats (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+            (key, delta),
+        )
+
+    def count(self) -> int:
+        return self._stat("doc_count")
+
+    def _remove(self, ids: list[str]) -> None:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            removed, removed_length = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE id IN ({placeholders})",
+                chunk,
+            ).fetchone()
+            self.conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", chunk)
+            self.conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", chunk)
+            self._add_stat("doc_count", -removed)
+            self._add_stat("total_length", -removed_length)
+
+    def add(self, snippets: list[Snippet]) -> None:
+        """
+        Index snippets, replacing any previous version with the same ID.
+        """
+        if not snippets:
+            return
+        self._remove([s.id for s in snippets])
+        total_length = 0
+        for snippet in snippets:
+            terms = Counter(tokenize(snippet_text(snippet)))
+            length = sum(terms.values())
+            total_length += length
+            self.conn.execute(
+                "INSERT INTO docs (id, length, file_path, type, name) VALUES (?, ?, ?, ?, ?)",
+                (snippet.id, length, snippet.file_path, snippet.type, snippet.name or ""),
+            )
+            self.conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                [(term, snippet.id, tf) for term, tf in terms.items()],
+            )
+        self._add_stat("doc_count", len(snippets))
+        self._add_stat("total_length", total_length)
+        self.conn.commit()
+
+    def delete(self, ids: list[str]) -> None:
+        self._remove(list(ids))
+        self.conn.commit()
+
+    def has_files(self, pattern: str) -> bool:
+        """
+        Check whether any indexed file path matches a glob pattern (`*` also
+        matches across directories).
+        """
+        row = self.conn.execute(
+            "SELECT 1 FROM docs WHERE file_path GLOB ? LIMIT 1", (pattern,)
+        ).fetchone()
+        return row is not None
+
+    def file_paths(self, pattern: str) -> Optional[list[str]]:
+        """
+        Returns the indexed file paths matching a glob pattern, or None if
+        it matches every indexed file.
+        """
+        matched, every = [], True
+        for file_path, match in self.conn.execute(
+            "SELECT file_path, file_path GLOB ? FROM docs GROUP BY file_path", (pattern,)
+        ):
+            if match:
+                matched.append(file_path)
+            else:
+                every = False
+        return None if every else matched
+
+    def search(
+        self, q: str, n_results: int = 5, where: Optional[Where] = None
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the top `n_results` (snippet ID, BM25 score) pairs for a query,
+        only scoring documents that match `where`. Term statistics stay those
+        of the whole index, so filtering does not change scores.
+        """
+        doc_count = self.count()
+        if doc_count <= 0:
+            return []
+        avg_length = self._stat("total_length") / doc_count
+        condition, params = where_to_sql(where, lambda field: f"d.{field}") if where else ("1", [])
+        scores: dict[str, float] = {}
+        for term in set(tokenize(q)):
+            postings = self.conn.execute(
+                "SELECT p.doc_id, p.tf, d.length FROM postings p "
+                f"JOIN docs d ON d.id = p.doc_id WHERE p.term = ? AND {condition}",
+                (term, *params),
+            ).fetchall()
+            if not postings:
+                continue
+            if where:
+                (df,) = self.conn.execute(
+                    "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+                ).fetchone()
+            else:
+                df = len(postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for doc_id, tf, length in postings:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM postings")
+        self.conn.execute("DELETE FROM docs")
+        self.conn.execute("DELETE FROM stats")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
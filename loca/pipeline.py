@@ -0,0 +1,104 @@
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+from .constants import PIPELINE_QUEUE_SIZE
+
+# Sent down the queues after the last item
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Runs a chain of stages, each in its own thread and connected by bounded
+    queues, so that every stage works on a different item at the same time
+    and at most `maxsize` items wait between two stages. Each stage takes the
+    previous stage's result; items put into the pipeline go to the first one.
+    The first exception raised by a stage stops the pipeline and is re-raised
+    to the producer by `put` or on exit. The last stage's results are
+    collected for the producer to pick up with `completed`.
+    """
+
+    def __init__(
+        self, stages: list[Callable[[Any], Any]], maxsize: int = PIPELINE_QUEUE_SIZE
+    ) -> None:
+        self.queues: list[queue.Queue] = [queue.Queue(maxsize) for _ in stages]
+        self.results: queue.Queue = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self.stopped = threading.Event()
+        self.closed = False
+        self.threads = [
+            threading.Thread(target=self._run, args=(i, stage), daemon=True)
+            for i, stage in enumerate(stages)
+        ]
+
+    def __enter__(self) -> "Pipeline":
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc is not None:
+            # The producer failed: drop the queued items instead of processing them
+            self.stopped.set()
+        self.close(raise_error=exc is None)
+
+    def close(self, raise_error: bool = True) -> None:
+        """
+        Wait until every item put so far went through all stages.
+        """
+        if not self.closed:
+            self.closed = True
+            self._put(0, _DONE)
+            for thread in self.threads:
+                thread.join()
+        if raise_error and self.error is not None:
+            raise self.error
+
+    def completed(self) -> list[Any]:
+        """
+        Return the results the last stage produced since the previous call,
+        in order, without waiting.
+        """
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def put(self, item: Any) -> None:
+        self._put(0, item)
+        if self.error is not None:
+            raise self.error
+
+    def _put(self, i: int, item: Any) -> None:
+        while True:
+            try:
+                self.queues[i].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                # Stopped stages only drain their queue, so only the end marker is still delivered
+                if self.stopped.is_set() and item is not _DONE:
+                    return
+
+    def _run(self, i: int, stage: Callable[[Any], Any]) -> None:
+        last = i == len(self.queues) - 1
+        while True:
+            item = self.queues[i].get()
+            if item is _DONE:
+                if not last:
+                    self._put(i + 1, _DONE)
+                return
+            if self.stopped.is_set():
+                continue
+            try:
+                result = stage(item)
+            except BaseException as e:
+                self.error = self.error or e
+                self.stopped.set()
+                continue
+            if last:
+                self.results.put(result)
+            else:
+                self._put(i + 1, result)
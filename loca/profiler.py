@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Iterator, Optional
+
+from colorama import Style
+
+from .constants import PROFILE_ENV
+
+# (name, start seconds, wall seconds, cpu seconds, items, bytes, pid, thread id)
+StageRecord = tuple[str, float, float, float, int, int, int, int]
+
+
+class StageCounts:
+    """
+    Items and bytes processed by a stage call, which the timed block may
+    update once they are known.
+    """
+
+    __slots__ = ("items", "bytes")
+
+    def __init__(self, items: int = 0, bytes: int = 0) -> None:
+        self.items = items
+        self.bytes = bytes
+
+
+# Returned by `stage` while profiling is off; updates to its counts are ignored
+_DISABLED = nullcontext(StageCounts())
+
+
+class Profiler:
+    """
+    Collects wall and CPU time, item counts and bytes per pipeline stage, and
+    the size, token count and duration of every embedder batch. Disabled by
+    default, in which case `stage` returns a shared no-op context manager.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.records: list[StageRecord] = []
+        # (texts, tokens or None, seconds) per embedder batch
+        self.batches: list[tuple[int, Optional[int], float]] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._start = time.perf_counter()
+
+    def start_worker(self) -> None:
+        """
+        Pool initializer: profile in the worker process, dropping any records
+        inherited from the parent by fork.
+        """
+        self.enabled = True
+        self.records = []
+        self.batches = []
+
+    def stage(self, name: str, items: int = 0, bytes: int = 0) -> ContextManager[StageCounts]:
+        """
+        Time the enclosed block as one call of stage `name`, e.g.
+        `with profiler.stage("scan") as counts: ...; counts.items = len(files)`.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name, items, bytes)
+
+    @contextmanager
+    def _timed(self, name: str, items: int, bytes: int) -> Iterator[StageCounts]:
+        counts = StageCounts(items, bytes)
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield counts
+        finally:
+            self.add(
+                name,
+                start,
+                time.perf_counter() - start,
+                time.process_time() - cpu_start,
+                counts.items,
+                counts.bytes,
+            )
+
+    def add(
+        self, name: str, start: float, wall: float, cpu: float, items: int = 0, bytes: int = 0
+    ) -> None:
+        with self._lock:
+            self.records.append(
+                (name, start, wall, cpu, items, bytes, os.getpid(), threading.get_ident())
+            )
+
+    def record_batch(self, texts: int, tokens: Optional[int], seconds: float) -> None:
+        with self._lock:
+            self.batches.append((texts, tokens, seconds))
+
+    def drain(self) -> list[StageRecord]:
+        """
+        Return and forget the stage records, e.g. to send them from a worker
+        process to the parent, which passes them to `merge`.
+        """
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+    def merge(self, records: list[StageRecord]) -> None:
+        with self._lock:
+            self.records.extend(records)
+
+    def drain_batches(self) -> list[tuple[int, Optional[int], float]]:
+        """
+        Return and forget the embedder batch records, like `drain`.
+        """
+        with self._lock:
+            batches, self.batches = self.batches, []
+        return batches
+
+    def merge_batches(self, batches: list[tuple[int, Optional[int], float]]) -> None:
+        with self._lock:
+            self.batches.extend(batches)
+
+    def stages(self) -> dict[str, dict[str, float]]:
+        """
+        Totals per stage, in the order stages first ran. Stages that ran in
+        worker processes sum the time of every worker.
+        """
+        totals: dict[str, dict[str, float]] = {}
+        for name, _, wall, cpu, items, bytes, _, _ in self.records:
+            total = totals.setdefault(
+                name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "items": 0, "bytes": 0}
+            )
+            total["calls"] += 1
+            total["wall_s"] += wall
+            total["cpu_s"] += cpu
+            total["items"] += items
+            total["bytes"] += bytes
+        return totals
+
+    def embedder_stats(self) -> dict[str, Any]:
+        if not self.batches:
+            return {}
+        sizes = [texts for texts, _, _ in self.batches]
+        seconds = sum(s for _, _, s in self.batches)
+        stats: dict[str, Any] = {
+            "batches": len(sizes),
+            "texts": sum(sizes),
+            "min_batch": min(sizes),
+            "mean_batch": sum(sizes) / len(sizes),
+            "max_batch": max(sizes),
+            "seconds": seconds,
+            "texts_per_s": sum(sizes) / seconds if seconds else 0.0,
+        }
+        if all(tokens is not None for _, tokens, _ in self.batches):
+            tokens = sum(t for _, t, _ in self.batches)
+            stats["tokens"] = tokens
+            stats["tokens_per_s"] = tokens / seconds if seconds else 0.0
+        return stats
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self._start
+        lines = [
+            f"{'stage':22} {'calls':>7} {'wall s':>9} {'cpu s':>9} {'items':>9} {'bytes':>11} {'items/s':>10}",
+        ]
+        for name, s in self.stages().items():
+            rate = f"{s['items'] / s['wall_s']:10.0f}" if s["items"] and s["wall_s"] else f"{'-':>10}"
+            lines.append(
+                f"{name:22} {s['calls']:7d} {s['wall_s']:9.3f} {s['cpu_s']:9.3f} "
+                f"{s['items']:9d} {format_bytes(s['bytes']):>11} {rate}"
+            )
+        lines.append(f"{'total':22} {'':7} {total:9.3f}")
+        embedder = self.embedder_stats()
+        if embedder:
+            line = (
+                f"\nEmbedder: {embedder['batches']} batches of "
+                f"{embedder['min_batch']}-{embedder['max_batch']} texts "
+                f"(mean {embedder['mean_batch']:.1f}), {embedder['texts_per_s']:.1f} texts/s"
+            )
+            if "tokens" in embedder:
+                line += f", {embedder['tokens']} tokens at {embedder['tokens_per_s']:.0f} tokens/s"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def write(self, path: Path) -> None:
+        """
+        Write the per-stage totals and embedder statistics as JSON, together
+        with every stage call as Chrome trace events, so the same file can be
+        read by scripts and opened in chrome://tracing or Perfetto.
+        """
+        report = {
+            "stages": self.stages(),
+            "embedder": self.embedder_stats(),
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": wall * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"cpu_s": cpu, "items": items, "bytes": bytes},
+                }
+                for name, start, wall, cpu, items, bytes, pid, tid in self.records
+            ],
+            "displayTimeUnit": "ms",
+        }
+        path.write_text(json.dumps(report) + "\n", encoding="utf-8")
+
+    def report(self, target: str) -> None:
+        """
+        Print the summary table, and write the report to `target` unless it is "".
+        """
+        print(f"\n{Style.BRIGHT}⏱  Profile{Style.RESET_ALL}\n{self.summary()}\n")
+        if target:
+            self.write(Path(target))
+            print(f"Profile written to {target} (open it in chrome://tracing or Perfetto)\n")
+
+
+def start_profiled_worker() -> None:
+    """
+    Pool initializer that profiles in the worker process; unlike the bound
+    `profiler.start_worker`, it can be pickled for spawned workers.
+    """
+    profiler.start_worker()
+
+
+def format_bytes(size: float) -> str:
+    if not size:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return str(size)
+
+
+def profile_target(flag: Optional[str]) -> Optional[str]:
+    """
+    Resolve `--profile [FILE]` and the LOCA_PROFILE environment variable into
+    None (profiling off), "" (print the summary only) or a file to write.
+    """
+    if flag is not None:
+        return flag
+    value = os.environ.get(PROFILE_ENV, "")
+    if value.lower() in ("", "0", "false", "no", "off"):
+        return None
+    return "" if value.lower() in ("1", "true", "yes", "on") else value
+
+
+profiler = Profiler()
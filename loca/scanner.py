@@ -0,0 +1,175 @@
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from .config import load_config
+from .constants import DEFAULT_EXCLUDES, EXCLUDE_KEY, IGNORE_FILENAMES, VENV_PATH
+
+
+def _translate_segment(segment: str) -> str:
+    """
+    Translate one path segment of a gitignore pattern into a regex; wildcards
+    never match "/".
+    """
+    regex = ""
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        if c == "\\" and i + 1 < len(segment):
+            regex += re.escape(segment[i + 1])
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[" and (end := segment.find("]", i + 2)) != -1:
+            body = segment[i + 1 : end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            regex += "[" + body.replace("\\", "\\\\") + "]"
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
+
+
+def compile_pattern(line: str) -> Optional[tuple["re.Pattern[str]", bool, bool]]:
+    """
+    Compile one line of a .gitignore-style file.
+    Returns (regex over paths relative to the file's directory, negated,
+    directories only), or None for blank lines and comments.
+    """
+    line = line.rstrip("\n")
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated or line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to the file's directory
+    anchored = "/" in line
+    segments = line.lstrip("/").split("/")
+    regex = ""
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            regex += ".*" if last else "(?:[^/]+/)*"
+        else:
+            regex += _translate_segment(segment) + ("" if last else "/")
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(f"^{prefix}{regex}$"), negated, dir_only
+
+
+class IgnoreRules:
+    """
+    The patterns of one ignore file (or of the configured excludes), matched
+    against paths relative to the directory they apply to.
+    """
+
+    def __init__(self, base: str, lines: Iterable[str]) -> None:
+        # Path of that directory relative to the project root, "" for the root
+        self.base = base
+        self.patterns = [p for p in map(compile_pattern, lines) if p is not None]
+
+    @classmethod
+    def from_file(cls, base: str, path: str) -> Optional["IgnoreRules"]:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                rules = cls(base, f)
+        except OSError:
+            return None
+        return rules if rules.patterns else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Returns True if the last matching pattern ignores `rel_path`, False if
+        it re-includes it, or None if no pattern matches.
+        """
+        if self.base:
+            rel_path = rel_path[len(self.base) + 1 :]
+        for regex, negated, dir_only in reversed(self.patterns):
+            if (is_dir or not dir_only) and regex.match(rel_path):
+                return not negated
+        return None
+
+
+def is_ignored(rules: list[IgnoreRules], rel_path: str, is_dir: bool) -> bool:
+    # Deeper ignore files take precedence over those of their parents
+    for ruleset in reversed(rules):
+        matched = ruleset.match(rel_path, is_dir)
+        if matched is not None:
+            return matched
+    return False
+
+
+def get_excludes() -> list[str]:
+    """
+    Get the exclude patterns added with `loca exclude`.
+    """
+    excludes = load_config().get(EXCLUDE_KEY, [])
+    return [p for p in excludes if isinstance(p, str)] if isinstance(excludes, list) else []
+
+
+def walk_python_files(
+    root: Path, excludes: Optional[list[str]] = None
+) -> Iterator[tuple[Path, list[os.DirEntry]]]:
+    """
+    Walk the project with `os.scandir`, yielding every directory that is kept
+    together with the entries of its Python files. Directories are pruned
+    before they are read if they hold a `pyvenv.cfg` (virtualenvs), are the
+    running interpreter's environment, or match the default excludes, the
+    configured excludes or a `.gitignore`/`.locaignore` pattern. Symlinked
+    files and directories are skipped, so only the root is ever resolved.
+    """
+    excludes = get_excludes() if excludes is None else excludes
+    base_rules = IgnoreRules("", [*DEFAULT_EXCLUDES, *excludes])
+    venv_path = str(VENV_PATH)
+    real_root = str(root.resolve())
+
+    def walk(directory: Path, rel: str, real: str, rules: list[IgnoreRules]):
+        if real == venv_path:
+            return
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            return
+        names = {entry.name for entry in entries}
+        if "pyvenv.cfg" in names:
+            return
+        for filename in IGNORE_FILENAMES:
+            if filename in names:
+                ruleset = IgnoreRules.from_file(rel, os.path.join(directory, filename))
+                if ruleset is not None:
+                    rules = [*rules, ruleset]
+
+        files: list[os.DirEntry] = []
+        subdirs: list[os.DirEntry] = []
+        for entry in entries:
+            try:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry)
+                elif entry.name.endswith(".py"):
+                    files.append(entry)
+            except OSError:
+                continue
+        prefix = f"{rel}/" if rel else ""
+        yield directory, [
+            entry for entry in files if not is_ignored(rules, prefix + entry.name, False)
+        ]
+        for entry in subdirs:
+            sub_rel = prefix + entry.name
+            if not is_ignored(rules, sub_rel, True):
+                yield from walk(Path(entry.path), sub_rel, os.path.join(real, entry.name), rules)
+
+    yield from walk(root, "", real_root, [base_rules])
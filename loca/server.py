@@ -0,0 +1,99 @@
+import json
+import os
+import socket
+import socketserver
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .constants import SERVER_SOCKET_FILENAME, SERVER_TIMEOUT
+from .utils import get_project_cache_path
+
+
+Handler = Callable[[str, dict[str, Any]], Any]
+
+
+def socket_path() -> Path:
+    """
+    Path of the query server's Unix socket for the current project.
+    """
+    return get_project_cache_path() / SERVER_SOCKET_FILENAME
+
+
+def is_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def request(method: str, timeout: float = SERVER_TIMEOUT, **params: Any) -> Optional[Any]:
+    """
+    Send a request to the running query server.
+    Returns the result, or None if no server is reachable.
+    Raises RuntimeError if the server reports an error.
+    """
+    if not is_supported():
+        return None
+    path = socket_path()
+    if not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps({"method": method, "params": params}).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError:
+        return None
+    if not line:
+        return None
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON request per line and answers with one JSON response per line.
+    """
+
+    server: "QueryServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                payload = json.loads(line)
+                if payload["method"] == "ping":
+                    result = "pong"
+                else:
+                    result = self.server.handler(
+                        payload["method"], payload.get("params", {})
+                    )
+                response = {"result": result}
+            except Exception as e:
+                response = {"error": f"❌ Query server error: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class QueryServer(socketserver.UnixStreamServer):
+    """
+    Local Unix-socket server that dispatches requests to `handler`, which keeps
+    the embedder and collection loaded between requests.
+    """
+
+    def __init__(self, path: Path, handler: Handler) -> None:
+        self.path = path
+        self.handler = handler
+        if path.exists():
+            if request("ping", timeout=1.0) is not None:
+                raise RuntimeError(f"❌ A query server is already running on {path}.")
+            # Stale socket left behind by a server that did not shut down cleanly
+            path.unlink()
+        super().__init__(str(path), RequestHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,6 +1,16 @@
 from pathlib import Path
-from typing import Literal, Any
+from typing import Literal, Any, Optional
 import ast
+import re
+
+from .constants import METADATA_DOCSTRING_MAX_CHARS
+
+
+# Bump whenever extraction changes the code or IDs it produces for the same
+# source, so that indexes built by an older version are re-extracted.
+EXTRACTOR_VERSION = 3
+
+SourceMode = Literal["slice", "unparse"]
 
 
 class Snippet:
@@ -14,6 +24,7 @@ class Snippet:
         name: str = "",
         line_end: int | None = None,
         docstring: str | None = None,
+        qualname: str = "",
     ) -> None:
         self.file_path = file_path
         self.line_start = line_start
@@ -22,10 +33,16 @@ class Snippet:
         self.type = type
         self.name = name
         self.docstring = docstring or ""
+        self.qualname = qualname
 
     @property
     def id(self) -> str:
-        return f"{self.file_path}:{self.line_start}"
+        """
+        Identity of the snippet, derived from its qualified symbol path so that
+        it survives code moving up or down the file. Line numbers are only
+        used as a fallback for snippets without a qualified name.
+        """
+        return f"{self.file_path}:{self.qualname or self.line_start}"
 
     def get_embedding_text(self) -> str:
         """
@@ -34,15 +51,22 @@ class Snippet:
         """
         return f"code: {self.code}, filename: {Path(self.file_path).stem} type: {self.type}, {'name: ' + self.name if self.name else ''}, {'docstring: ' + self.docstring if self.docstring else ''}"
 
-    def to_dict(self) -> dict[str, Any]:
+    def to_metadata(self) -> dict[str, Any]:
+        """
+        The fields stored next to the snippet's code: everything but the code
+        itself, with the docstring (which the code contains) cut short.
+        """
+        docstring = self.docstring
+        if len(docstring) > METADATA_DOCSTRING_MAX_CHARS:
+            docstring = docstring[: METADATA_DOCSTRING_MAX_CHARS - 1].rstrip() + "…"
         return {
             "file_path": self.file_path,
             "line_start": self.line_start,
             "line_end": self.line_end,
-            "code": self.code,
             "type": self.type,
             "name": self.name,
-            "docstring": self.docstring,
+            "docstring": docstring,
+            "qualname": self.qualname,
         }
 
     @classmethod
@@ -55,6 +79,7 @@ class Snippet:
             type=data.get("type", "unknown"),
             name=data.get("name", ""),
             docstring=data.get("docstring", ""),
+            qualname=data.get("qualname", ""),
         )
 
     def __repr__(self) -> str:
@@ -71,20 +96,119 @@ class Snippet:
         )
 
 
-def extract_import(node: ast.Import | ast.ImportFrom, file_path: str) -> Snippet:
-    import_str = ast.unparse(node)
+# The line ends the Python tokenizer counts; str.splitlines also breaks on
+# form feeds, vertical tabs, \x1c-\x1e, \x85 and the Unicode line separators
+_LINE_END = re.compile(r"\r\n|\r|\n")
+
+
+def split_lines(text: str) -> list[str]:
+    """
+    Split `text` into lines, keeping their ends, exactly where AST line numbers change.
+    """
+    lines = []
+    start = 0
+    for match in _LINE_END.finditer(text):
+        lines.append(text[start : match.end()])
+        start = match.end()
+    if start < len(text):
+        lines.append(text[start:])
+    return lines
+
+
+def strip_indent(line: str, indent: int) -> str:
+    """
+    Remove up to `indent` leading spaces and tabs of a line. Lines indented
+    less than that, such as the inside of a multiline string, are kept as they
+    are, unless they are blank.
+    """
+    leading = len(line) - len(line.lstrip(" \t"))
+    if leading >= indent:
+        return line[indent:]
+    if not line.strip():
+        return line[leading:]
+    return line
+
+
+class SourceText:
+    """
+    Original text of a file with a line-offset table built once, so the exact
+    source of any node can be sliced out in time proportional to its length.
+    """
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.lines = split_lines(content)
+        self.line_offsets = [0]
+        for line in self.lines:
+            self.line_offsets.append(self.line_offsets[-1] + len(line))
+
+    def offset(self, lineno: int, col_offset: int) -> int:
+        """
+        Character offset of an AST position. AST column offsets count UTF-8
+        bytes, which only differ from characters on non-ASCII lines.
+        """
+        line = self.lines[lineno - 1] if lineno <= len(self.lines) else ""
+        if not line.isascii():
+            col_offset = len(line.encode("utf-8")[:col_offset].decode("utf-8", "ignore"))
+        return self.line_offsets[lineno - 1] + col_offset
+
+    def segment(self, node: ast.stmt) -> str:
+        """
+        Source of a statement. Definitions are sliced as whole lines, from
+        their first decorator to the end of their last line (keeping trailing
+        comments), and dedented by the definition's indentation so methods
+        read like top-level code.
+        """
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            lineno = min([node.lineno, *(d.lineno for d in node.decorator_list)])
+            lines = self.lines[lineno - 1 : node.end_lineno]
+            # Indentation is ASCII, so the byte column offset counts characters
+            return "".join(strip_indent(line, node.col_offset) for line in lines).rstrip("\r\n")
+        start = self.offset(node.lineno, node.col_offset)
+        return self.content[start : self.offset(node.end_lineno, node.end_col_offset)]
+
+
+def node_code(node: ast.stmt, source: Optional[SourceText]) -> str:
+    return source.segment(node) if source is not None else ast.unparse(node)
+
+
+def import_qualname(node: ast.Import | ast.ImportFrom) -> str:
+    """
+    Qualified name of an import statement, built from the names it imports.
+    """
+    if isinstance(node, ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        separator = "" if module.endswith(".") else "."
+        names = [f"{module}{separator}{alias.name}" for alias in node.names]
+    else:
+        names = [alias.name for alias in node.names]
+    return "import:" + ",".join(names)
+
+
+def extract_import(
+    node: ast.Import | ast.ImportFrom,
+    file_path: str,
+    source: Optional[SourceText] = None,
+) -> Snippet:
+    import_str = node_code(node, source)
     return Snippet(
         file_path=file_path,
         line_start=node.lineno,
         line_end=node.end_lineno,
         code=import_str,
         type="import",
+        qualname=import_qualname(node),
     )
 
 
-def extract_global_variables(node: ast.Assign, file_path: str) -> list[Snippet]:
+def extract_global_variables(
+    node: ast.Assign, file_path: str, source: Optional[SourceText] = None
+) -> list[Snippet]:
 
     var_names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+    if not var_names:
+        return []
+    code = node_code(node, source)
     snippets = []
     for var in var_names:
         snippets.append(
@@ -92,61 +216,120 @@ def extract_global_variables(node: ast.Assign, file_path: str) -> list[Snippet]:
                 file_path=file_path,
                 line_start=node.lineno,
                 line_end=node.end_lineno,
-                code=ast.unparse(node),
+                code=code,
                 type="global variable",
                 name=var,
+                qualname=var,
             )
         )
     return snippets
 
 
-def extract_class(node: ast.ClassDef, file_path: str) -> Snippet:
+def extract_class(
+    node: ast.ClassDef,
+    file_path: str,
+    qualname: str = "",
+    source: Optional[SourceText] = None,
+) -> Snippet:
     return Snippet(
         file_path=file_path,
         line_start=node.lineno,
         line_end=node.end_lineno,
-        code=ast.unparse(node),
+        code=node_code(node, source),
         type="class",
         name=node.name,
         docstring=ast.get_docstring(node),
+        qualname=qualname or node.name,
     )
 
 
-def extract_function(node: ast.FunctionDef, file_path: str) -> Snippet:
+def extract_function(
+    node: ast.FunctionDef,
+    file_path: str,
+    qualname: str = "",
+    source: Optional[SourceText] = None,
+) -> Snippet:
 
     return Snippet(
         file_path=file_path,
         line_start=node.lineno,
         line_end=node.end_lineno,
-        code=ast.unparse(node),
+        code=node_code(node, source),
         type="function",
         name=node.name,
         docstring=ast.get_docstring(node),
+        qualname=qualname or node.name,
     )
 
 
-def extract_snippets(file_path: str, content: str) -> list:
+def extract_definitions(
+    node: ast.AST,
+    file_path: str,
+    scope: list[str],
+    snippets: list[Snippet],
+    source: Optional[SourceText] = None,
+) -> None:
+    """
+    Recursively collect class and function snippets below `node`, naming each
+    one by its qualified path the way Python's `__qualname__` does.
+    """
+    for child in ast.iter_child_nodes(node):
+
+        if isinstance(child, ast.ClassDef):
+            qualname = ".".join([*scope, child.name])
+            snippets.append(extract_class(child, file_path, qualname, source))
+            extract_definitions(
+                child, file_path, [*scope, child.name], snippets, source
+            )
+
+        elif isinstance(child, ast.FunctionDef):
+            qualname = ".".join([*scope, child.name])
+            snippets.append(extract_function(child, file_path, qualname, source))
+            extract_definitions(
+                child, file_path, [*scope, child.name, "<locals>"], snippets, source
+            )
+
+        elif isinstance(child, ast.AsyncFunctionDef):
+            extract_definitions(
+                child, file_path, [*scope, child.name, "<locals>"], snippets, source
+            )
+
+        else:
+            extract_definitions(child, file_path, scope, snippets, source)
+
+
+def disambiguate_qualnames(snippets: list[Snippet]) -> None:
+    """
+    Suffix repeated qualified names (redefinitions, property setters, ...) with
+    `#2`, `#3`, ... in source order, leaving the first occurrence untouched.
+    """
+    seen: dict[str, int] = {}
+    for snippet in sorted(snippets, key=lambda s: s.line_start):
+        count = seen.get(snippet.qualname, 0) + 1
+        seen[snippet.qualname] = count
+        if count > 1:
+            snippet.qualname = f"{snippet.qualname}#{count}"
+
+
+def extract_snippets(file_path: str, content: str, mode: SourceMode = "slice") -> list:
+    """
+    Extract the snippets of a file. In "slice" mode the code of each snippet
+    is its original source text, comments included; "unparse" regenerates it
+    from the AST instead.
+    """
     tree = ast.parse(content)
+    source = SourceText(content) if mode == "slice" else None
     snippets = []
 
     for node in tree.body:
 
         if isinstance(node, (ast.Import, ast.ImportFrom)):
-            snippets.append(extract_import(node, file_path))
+            snippets.append(extract_import(node, file_path, source))
 
         elif isinstance(node, ast.Assign):
-            snippets.extend(extract_global_variables(node, file_path))
-
-    for node in ast.walk(tree):
-
-        if isinstance(node, ast.ClassDef):
-
-            snippets.append(extract_class(node, file_path))
-
-        elif isinstance(node, ast.FunctionDef):
-            snippet = extract_function(node, file_path)
+            snippets.extend(extract_global_variables(node, file_path, source))
 
-            if snippet:
-                snippets.append(snippet)
+    extract_definitions(tree, file_path, [], snippets, source)
+    disambiguate_qualnames(snippets)
 
     return snippets
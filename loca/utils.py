@@ -1,12 +1,25 @@
 import hashlib
 from pathlib import Path
-from typing import Set
+from itertools import islice
+from typing import Iterable, Iterator, Optional, TypeVar
 
 from platformdirs import user_cache_dir
 
 
 from .config import load_config
-from .constants import CURRENT_PROJECT_ROOT_KEY, VENV_PATH
+from .constants import (
+    BATCH_SIZE_KEY,
+    CURRENT_PROJECT_ROOT_KEY,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_STORE,
+    PROJECT_ROOTS_KEY,
+    STORE_BACKENDS,
+    STORE_KEY,
+)
+from .scanner import walk_python_files
+
+
+T = TypeVar("T")
 
 
 def read_file(path: str) -> str:
@@ -14,48 +27,83 @@ def read_file(path: str) -> str:
         return f.read()
 
 
-def starts_with_any(string: str, prefixes: Set[str]) -> bool:
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
     """
-    Check if the string starts with any of the given prefixes.
+    Yield consecutive chunks of `items` with at most `size` elements each,
+    consuming iterators lazily.
     """
-    return any(string.startswith(f"{prefix}:") for prefix in prefixes)
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
-def find_venvs(path: Path) -> Set[Path]:
+def get_registered_roots() -> list[Path]:
     """
-    Find all virtual environments in the given path.
+    Get every registered project root: the one set with `loca set-root`
+    followed by those added with `loca add-root`.
     """
-    return {cfg.parent for cfg in path.rglob("pyvenv.cfg")}
+    config = load_config()
+    roots = [Path(root).resolve() for root in config.get(PROJECT_ROOTS_KEY, [])]
+    current_root = config.get(CURRENT_PROJECT_ROOT_KEY)
+    if current_root and Path(current_root).resolve() not in roots:
+        roots.insert(0, Path(current_root).resolve())
+    return roots
 
 
 def get_project_root() -> Path:
-    config = load_config()
+    """
+    Get the registered root the working directory is in (the innermost one
+    if roots are nested).
+    """
     cwd = Path.cwd().resolve()
-    project_root = config.get(CURRENT_PROJECT_ROOT_KEY)
-    project_root_path = Path(project_root).resolve() if project_root else None
-    if not project_root_path or not cwd.is_relative_to(project_root_path):
+    containing = [root for root in get_registered_roots() if cwd.is_relative_to(root)]
+    if not containing:
         raise RuntimeError(
             "❌ Project root not set in configuration. Please set it using `loca set-root` command."
         )
-    return project_root_path
+    return max(containing, key=lambda root: len(root.parts))
+
+
+def get_batch_size() -> int:
+    """
+    Get the embedding batch size from the configuration, or the default.
+    """
+    config = load_config()
+    batch_size = config.get(BATCH_SIZE_KEY, DEFAULT_BATCH_SIZE)
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return DEFAULT_BATCH_SIZE
+    return batch_size
+
+
+def get_store_backend() -> str:
+    """
+    Get the vector store backend from the configuration, or the default.
+    """
+    store = load_config().get(STORE_KEY, DEFAULT_STORE)
+    return store if store in STORE_BACKENDS else DEFAULT_STORE
+
+
+def get_cache_root() -> Path:
+    """
+    Get the directory holding the caches of every project and those they share.
+    """
+    return Path(user_cache_dir("loca"))
 
 
-def get_project_cache_path() -> Path:
+def get_project_cache_path(project_root: Optional[Path] = None) -> Path:
     """
-    Get the path to the project cache directory.
+    Get the path to the cache directory of a project, by default the current one.
     """
-    project_root = get_project_root()
+    if project_root is None:
+        project_root = get_project_root()
     root_bytes = str(project_root.resolve()).encode("utf-8")
     project_hash = hashlib.sha1(root_bytes).hexdigest()[:10]
-    return Path(user_cache_dir("loca")) / project_hash
+    return get_cache_root() / project_hash
 
 
 def scan_python_files(path: Path) -> list[Path]:
     """
-    Recursively find all Python files in the project, excluding venv.
+    Recursively find all Python files in the project, skipping virtualenvs
+    and ignored or excluded directories (see `walk_python_files`).
     """
-    return [
-        f
-        for f in path.rglob("*.py")
-        if not (f.is_symlink() or f.resolve().is_relative_to(VENV_PATH))
-    ]
+    return [Path(entry.path) for _, entries in walk_python_files(path) for entry in entries]
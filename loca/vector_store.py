@@ -0,0 +1,325 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+from .constants import VECTOR_STORE_COMPACT_MIN_ROWS
+from .filters import Where, split_clause
+
+
+# Metadata fields that `where` filters can test, kept in memory per row
+_FILTER_FIELDS = ("type", "file_path", "name")
+
+
+def _dump_metadata(metadata: dict[str, Any]) -> str:
+    # Metadata is replaced as a whole; as with ChromaDB, None values drop the key
+    return json.dumps({key: value for key, value in metadata.items() if value is not None})
+
+
+class NumpyVectorStore:
+    """
+    Exact-search vector store answering the subset of the ChromaDB collection
+    API that loca uses. Embeddings live in a memory-mapped float32 matrix
+    (shared page cache across processes); ids, documents and metadata live in
+    SQLite. Rows are append-only: replacing or deleting a record tombstones
+    its row, and the matrix is rewritten once tombstones outnumber live rows.
+    Queries reload the row tables and the map when another process (e.g.
+    `loca index` next to `loca serve`) has written to the store since.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Opened and used from different threads by `query_all`, never concurrently
+        self.conn = sqlite3.connect(path / "records.sqlite3", check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+        self._matrix: Optional[np.ndarray] = None
+        self._row_ids: Optional[np.ndarray] = None
+        self._live: Optional[np.ndarray] = None
+        # Per filter field: the distinct values and each row's index into them
+        self._fields: dict[str, tuple[dict[Any, int], np.ndarray]] = {}
+        self._data_version: Optional[int] = None
+
+    def _meta(self, key: str) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _vectors_path(self) -> Path:
+        # Compaction writes a new file, so readers holding the old map are unaffected
+        return self.path / f"vectors-{self._meta('file')}.f32"
+
+    def _invalidate(self) -> None:
+        self._matrix = None
+        self._row_ids = None
+        self._live = None
+        self._fields = {}
+
+    def _changed_elsewhere(self) -> bool:
+        """
+        Check whether another connection committed to the database since the
+        last call; this connection's own writes invalidate the tables directly.
+        """
+        (version,) = self.conn.execute("PRAGMA data_version").fetchone()
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def _load(self) -> None:
+        """
+        Map the matrix and build the row -> id table, the mask of live (not
+        tombstoned) rows and the filter fields of each row.
+        """
+        # Read in one transaction, so a concurrent compaction is seen entirely or not at all
+        self.conn.execute("BEGIN")
+        vectors_path = self._vectors_path()
+        try:
+            rows, dim = self._meta("rows"), self._meta("dim")
+            self._row_ids = np.full(rows, None, dtype=object)
+            self._live = np.zeros(rows, dtype=bool)
+            self._fields = {field: ({}, np.full(rows, -1, dtype=np.int32)) for field in _FILTER_FIELDS}
+            columns = ", ".join(f"json_extract(metadata, '$.{field}')" for field in _FILTER_FIELDS)
+            for row, id_, *values in self.conn.execute(f"SELECT row, id, {columns} FROM records"):
+                self._row_ids[row] = id_
+                self._live[row] = True
+                for (distinct, codes), value in zip(self._fields.values(), values):
+                    codes[row] = distinct.setdefault(value, len(distinct))
+            if rows == 0:
+                self._matrix = np.zeros((0, dim), dtype=np.float32)
+            elif not vectors_path.exists():
+                # Compacted and removed after this snapshot: the new file is committed by now
+                self.conn.commit()
+                return self._load()
+            else:
+                self._matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        finally:
+            self.conn.commit()
+
+    def count(self) -> int:
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()
+        return count
+
+    def upsert(
+        self,
+        ids: list[str],
+        documents: list[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        # Store unit vectors so that a dot product is the cosine similarity
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        rows, dim = self._meta("rows"), self._meta("dim")
+        if rows and vectors.shape[1] != dim:
+            raise RuntimeError(
+                f"❌ Embedding dimension {vectors.shape[1]} does not match the vector store ({dim}). Run `loca clear` and re-index."
+            )
+        # Write past the committed rows, overwriting anything left by an interrupted run
+        with open(self._vectors_path(), "ab") as f:
+            f.truncate(rows * vectors.shape[1] * 4)
+            f.write(vectors.tobytes())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO records (id, row, document, metadata) VALUES (?, ?, ?, ?)",
+            [
+                (id_, rows + i, document, _dump_metadata(metadata))
+                for i, (id_, document, metadata) in enumerate(zip(ids, documents, metadatas))
+            ],
+        )
+        self._set_meta("rows", rows + len(ids))
+        self._set_meta("dim", vectors.shape[1])
+        self.conn.commit()
+        self._invalidate()
+        self._maybe_compact()
+
+    def update(
+        self,
+        ids: list[str],
+        metadatas: list[dict[str, Any]],
+        documents: Optional[list[str]] = None,
+    ) -> None:
+        self.conn.executemany(
+            "UPDATE records SET metadata = ? WHERE id = ?",
+            [(_dump_metadata(metadata), id_) for id_, metadata in zip(ids, metadatas)],
+        )
+        if documents is not None:
+            self.conn.executemany(
+                "UPDATE records SET document = ? WHERE id = ?", list(zip(documents, ids))
+            )
+        self.conn.commit()
+        self._invalidate()
+
+    def delete(self, ids: list[str]) -> None:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            self.conn.execute(f"DELETE FROM records WHERE id IN ({placeholders})", chunk)
+        self.conn.commit()
+        self._invalidate()
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        rows, live = self._meta("rows"), self.count()
+        if rows < VECTOR_STORE_COMPACT_MIN_ROWS or rows - live <= live:
+            return
+        self._load()
+        old_path = self._vectors_path()
+        kept = np.flatnonzero(self._live)
+        new_file = self._meta("file") + 1
+        new_path = self.path / f"vectors-{new_file}.f32"
+        with open(new_path, "wb") as f:
+            for i in range(0, len(kept), 4096):
+                f.write(np.ascontiguousarray(self._matrix[kept[i : i + 4096]]).tobytes())
+        self.conn.executemany(
+            "UPDATE records SET row = ? WHERE id = ?",
+            [(-1 - new_row, self._row_ids[row]) for new_row, row in enumerate(kept)],
+        )
+        self.conn.execute("UPDATE records SET row = -1 - row")
+        self._set_meta("rows", len(kept))
+        self._set_meta("file", new_file)
+        self.conn.commit()
+        self._invalidate()
+        old_path.unlink(missing_ok=True)
+
+    def get(
+        self,
+        ids: Optional[list[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> dict[str, list]:
+        if ids is None:
+            records = self.conn.execute(
+                "SELECT id, document, metadata FROM records ORDER BY row LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset or 0),
+            ).fetchall()
+        else:
+            records = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                records.extend(
+                    self.conn.execute(
+                        f"SELECT id, document, metadata FROM records WHERE id IN ({placeholders})",
+                        chunk,
+                    )
+                )
+        result: dict[str, list] = {"ids": [id_ for id_, _, _ in records]}
+        if "documents" in include:
+            result["documents"] = [document for _, document, _ in records]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(metadata) for _, _, metadata in records]
+        return result
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+        where: Optional[Where] = None,
+    ) -> dict[str, list]:
+        """
+        Exact top-k by cosine similarity: one matrix product for all queries,
+        then `argpartition` per query. Distances are 1 - cosine similarity.
+        With `where`, rows whose metadata do not match are masked out.
+        """
+        if self._changed_elsewhere() or self._matrix is None:
+            self._load()
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries /= np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        mask = self._live if where is None else self._where_mask(where)
+        k = min(n_results, int(mask.sum()))
+        result: dict[str, list] = {"ids": [], "distances": []}
+        if k:
+            scores = queries @ self._matrix.T
+            scores[:, ~mask] = -np.inf
+        for i in range(len(queries)):
+            if not k:
+                result["ids"].append([])
+                result["distances"].append([])
+                continue
+            top = np.argpartition(-scores[i], k - 1)[:k]
+            top = top[np.argsort(-scores[i][top])]
+            result["ids"].append(self._row_ids[top].tolist())
+            result["distances"].append((1.0 - scores[i][top]).tolist())
+
+        fields = [key for key in ("documents", "metadatas") if key in include]
+        for key in fields:
+            result[key] = []
+        for i, ids in enumerate(result["ids"] if fields else []):
+            records = self.get(ids=ids, include=fields)
+            position = {id_: j for j, id_ in enumerate(records["ids"])}
+            # Records deleted by another process after the tables were loaded are skipped
+            kept = [j for j, id_ in enumerate(ids) if id_ in position]
+            result["ids"][i] = [ids[j] for j in kept]
+            result["distances"][i] = [result["distances"][i][j] for j in kept]
+            for key in fields:
+                result[key].append([records[key][position[ids[j]]] for j in kept])
+        if "distances" not in include:
+            del result["distances"]
+        return result
+
+    def _where_mask(self, where: Where) -> np.ndarray:
+        """
+        The mask of live rows matching the filters built by `build_where`.
+        """
+        if "$and" in where:
+            mask = self._live.copy()
+            for clause in where["$and"]:
+                mask &= self._where_mask(clause)
+            return mask
+        field, op, value = split_clause(where)
+        if op == "$eq":
+            values = [value]
+        elif op == "$in":
+            values = value
+        elif op == "$glob":
+            # Matched by SQLite on the distinct values, as by the lexical index
+            distinct_values = list(self._fields[field][0])
+            values = [
+                distinct_values[i]
+                for (i,) in self.conn.execute(
+                    "SELECT key FROM json_each(?) WHERE value GLOB ?",
+                    (json.dumps(distinct_values), value),
+                )
+            ]
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        distinct, codes = self._fields[field]
+        # The extra last entry is indexed by the -1 of tombstoned rows
+        matched = np.zeros(len(distinct) + 1, dtype=bool)
+        for v in values:
+            if v in distinct:
+                matched[distinct[v]] = True
+        return matched[codes]
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM records")
+        self.conn.execute("DELETE FROM meta")
+        self.conn.commit()
+        self._invalidate()
+        for vectors_path in self.path.glob("vectors-*.f32"):
+            vectors_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._invalidate()
+        self.conn.close()
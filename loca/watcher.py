@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from .constants import DEFAULT_WATCH_INTERVAL, WATCH_FILE_STAT_INTERVAL
+from .scanner import get_excludes, walk_python_files
+
+
+Signature = tuple[int, int, int]
+
+
+def signature(stat: os.stat_result) -> Signature:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def start_observer(root: Path, wakeup: threading.Event) -> Optional[Any]:
+    """
+    Set `wakeup` whenever a Python file or directory below `root` changes,
+    using the platform's file system notifications through watchdog.
+    Returns the running observer, or None if watchdog is not installed.
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event: Any) -> None:
+            paths = [event.src_path, getattr(event, "dest_path", "")]
+            # Directory modifications accompany every file event; moves and
+            # deletions of whole directories may not report their files
+            if (event.is_directory and event.event_type in ("moved", "deleted")) or any(
+                str(path).endswith(".py") for path in paths
+            ):
+                wakeup.set()
+
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(Handler(), str(root), recursive=True)
+    observer.start()
+    return observer
+
+
+class PollingWatcher:
+    """
+    Detects changes to Python files below a root by comparing stat signatures.
+    With watchdog installed, file system notifications say when to look, so
+    an idle tree costs nothing. Otherwise directory mtimes are polled every
+    `interval` and the directory tree is walked again when one changes (files
+    added, removed or renamed); known files, whose in-place edits leave their
+    directory untouched, are only stat'ed every `file_interval`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        file_interval: float = WATCH_FILE_STAT_INTERVAL,
+    ) -> None:
+        self.root = root
+        self.interval = interval
+        self.file_interval = max(interval, file_interval)
+        self.excludes = get_excludes()
+        self.wakeup = threading.Event()
+        self.observer = start_observer(root, self.wakeup)
+        self.dirs: dict[Path, int] = {}
+        self.files: dict[Path, Signature] = {}
+        self.dirs, self.files = self._scan()
+        self.files_checked = time.monotonic()
+
+    def _scan(self) -> tuple[dict[Path, int], dict[Path, Signature]]:
+        dirs: dict[Path, int] = {}
+        files: dict[Path, Signature] = {}
+        for directory, entries in walk_python_files(self.root, self.excludes):
+            try:
+                dirs[directory] = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    files[Path(entry.path)] = signature(entry.stat(follow_symlinks=False))
+                except FileNotFoundError:
+                    continue
+        return dirs, files
+
+    def _tree_changed(self) -> bool:
+        for directory, mtime_ns in self.dirs.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def poll(self, check_files: bool = True) -> tuple[set[Path], set[Path]]:
+        """
+        Check the tree once; without `check_files`, only directory changes are seen.
+        Returns (changed, deleted): new or modified files, and removed files.
+        """
+        if self._tree_changed():
+            self.dirs, files = self._scan()
+            self.files_checked = time.monotonic()
+        elif not check_files:
+            return set(), set()
+        else:
+            self.files_checked = time.monotonic()
+            files = {}
+            for file in self.files:
+                try:
+                    files[file] = signature(os.stat(file))
+                except FileNotFoundError:
+                    pass
+        changed = {f for f, sig in files.items() if self.files.get(f) != sig}
+        deleted = self.files.keys() - files.keys()
+        self.files = files
+        return changed, deleted
+
+    def close(self) -> None:
+        """
+        Stop the file system observer, if one was started.
+        """
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def wait_for_changes(self) -> tuple[set[Path], set[Path]]:
+        """
+        Block until files change, then keep polling until one interval passes
+        without further changes, so a burst of saves is handled as one batch.
+        """
+        changed: set[Path] = set()
+        deleted: set[Path] = set()
+        while True:
+            if self.observer is not None and not (changed or deleted):
+                self.wakeup.wait()
+            time.sleep(self.interval)
+            self.wakeup.clear()
+            check_files = (
+                self.observer is not None
+                or bool(changed or deleted)
+                or time.monotonic() - self.files_checked >= self.file_interval
+            )
+            new_changed, new_deleted = self.poll(check_files)
+            if not (new_changed or new_deleted):
+                if changed or deleted:
+                    return changed, deleted
+                continue
+            changed = (changed - new_deleted) | new_changed
+            deleted = (deleted - new_changed) | new_deleted